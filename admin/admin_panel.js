@@ -0,0 +1,240 @@
+const API_BASE = '';
+
+// Listings are paginated; follow the X-Next-Cursor header to the end
+async function fetchAll(path) {
+    const items = [];
+    let cursor = null;
+    do {
+        const url = `${API_BASE}${path}?limit=200` + (cursor ? `&after=${encodeURIComponent(cursor)}` : '');
+        const res = await fetch(url);
+        items.push(...await res.json());
+        cursor = res.headers.get('X-Next-Cursor');
+    } while (cursor);
+    return items;
+}
+
+// Tab switching
+function showTab(tabName) {
+    document.querySelectorAll('.tab').forEach(t => t.classList.remove('active'));
+    document.querySelectorAll('.section').forEach(s => s.classList.remove('active'));
+    event.target.classList.add('active');
+    document.getElementById(tabName).classList.add('active');
+
+    // Load data for specific tabs
+    if (tabName === 'courses') loadCourses();
+    if (tabName === 'gallery') loadGallery();
+}
+
+// Alert functions
+function showAlert(message, type = 'success') {
+    const alert = document.getElementById('alert');
+    alert.textContent = message;
+    alert.className = `alert ${type}`;
+    alert.style.display = 'block';
+    setTimeout(() => alert.style.display = 'none', 5000);
+}
+
+// Load data on page load
+async function loadHero() {
+    const res = await fetch(`${API_BASE}/api/hero`);
+    const data = await res.json();
+    const form = document.getElementById('heroForm');
+    Object.keys(data).forEach(key => {
+        const input = form.querySelector(`[name="${key}"]`);
+        if (input) input.value = data[key] || '';
+    });
+}
+
+async function loadAbout() {
+    const res = await fetch(`${API_BASE}/api/about`);
+    const data = await res.json();
+    const form = document.getElementById('aboutForm');
+    Object.keys(data).forEach(key => {
+        const input = form.querySelector(`[name="${key}"]`);
+        if (input) input.value = data[key] || '';
+    });
+}
+
+async function loadMissionVision() {
+    const res = await fetch(`${API_BASE}/api/mission-vision`);
+    const data = await res.json();
+    const form = document.getElementById('missionForm');
+    Object.keys(data).forEach(key => {
+        const input = form.querySelector(`[name="${key}"]`);
+        if (input) input.value = data[key] || '';
+    });
+}
+
+async function loadContact() {
+    const res = await fetch(`${API_BASE}/api/contact`);
+    const data = await res.json();
+    const form = document.getElementById('contactForm');
+    Object.keys(data).forEach(key => {
+        const input = form.querySelector(`[name="${key}"]`);
+        if (input) input.value = data[key] || '';
+    });
+}
+
+async function loadCourses() {
+    const courses = await fetchAll('/api/courses');
+    const container = document.getElementById('coursesList');
+    container.innerHTML = courses.map(course => `
+        <div class="card">
+            <form onsubmit="updateCourse(event, ${course.id})">
+                <div class="card-header">
+                    <div class="card-title">${course.title}</div>
+                </div>
+                <div class="form-group">
+                    <label>Title</label>
+                    <input type="text" name="title" value="${course.title}" required>
+                </div>
+                <div class="form-group">
+                    <label>Short Description</label>
+                    <textarea name="short_description" required>${course.short_description}</textarea>
+                </div>
+                <div class="form-group">
+                    <label>Image URL</label>
+                    <input type="text" name="image_url" value="${course.image_url}" required>
+                </div>
+                <div class="form-row">
+                    <div class="form-group">
+                        <label>Display Order</label>
+                        <input type="number" name="display_order" value="${course.display_order}">
+                    </div>
+                    <div class="form-group">
+                        <label>Active</label>
+                        <select name="is_active">
+                            <option value="true" ${course.is_active ? 'selected' : ''}>Yes</option>
+                            <option value="false" ${!course.is_active ? 'selected' : ''}>No</option>
+                        </select>
+                    </div>
+                </div>
+                <button type="submit" class="btn">Update Course</button>
+            </form>
+        </div>
+    `).join('');
+}
+
+async function loadGallery() {
+    const images = await fetchAll('/api/gallery');
+    const container = document.getElementById('galleryList');
+    container.innerHTML = `<div class="grid">` + images.map(img => `
+        <div class="card">
+            <img src="${API_BASE}/static/${img.image_url}" class="image-preview" style="max-width:100%;">
+            <form onsubmit="updateGalleryImage(event, ${img.id})">
+                <div class="form-group">
+                    <label>Image URL</label>
+                    <input type="text" name="image_url" value="${img.image_url}" required>
+                </div>
+                <div class="form-group">
+                    <label>Alt Text</label>
+                    <input type="text" name="alt_text" value="${img.alt_text}" required>
+                </div>
+                <div class="form-group">
+                    <label>Caption</label>
+                    <input type="text" name="caption" value="${img.caption || ''}">
+                </div>
+                <div class="form-row">
+                    <div class="form-group">
+                        <label>Order</label>
+                        <input type="number" name="display_order" value="${img.display_order}">
+                    </div>
+                    <div class="form-group">
+                        <label>Active</label>
+                        <select name="is_active">
+                            <option value="true" ${img.is_active ? 'selected' : ''}>Yes</option>
+                            <option value="false" ${!img.is_active ? 'selected' : ''}>No</option>
+                        </select>
+                    </div>
+                </div>
+                <button type="submit" class="btn">Update</button>
+                <button type="button" class="btn btn-danger" onclick="deleteGalleryImage(${img.id})">Delete</button>
+            </form>
+        </div>
+    `).join('') + `</div>`;
+}
+
+// Update functions
+async function updateHero(e) {
+    e.preventDefault();
+    const formData = new FormData(e.target);
+    const res = await fetch(`${API_BASE}/api/hero`, { method: 'PUT', body: formData });
+    const data = await res.json();
+    showAlert(data.message);
+}
+
+async function updateAbout(e) {
+    e.preventDefault();
+    const formData = new FormData(e.target);
+    const res = await fetch(`${API_BASE}/api/about`, { method: 'PUT', body: formData });
+    const data = await res.json();
+    showAlert(data.message);
+}
+
+async function updateMissionVision(e) {
+    e.preventDefault();
+    const formData = new FormData(e.target);
+    const res = await fetch(`${API_BASE}/api/mission-vision`, { method: 'PUT', body: formData });
+    const data = await res.json();
+    showAlert(data.message);
+}
+
+async function updateContact(e) {
+    e.preventDefault();
+    const formData = new FormData(e.target);
+    const res = await fetch(`${API_BASE}/api/contact`, { method: 'PUT', body: formData });
+    const data = await res.json();
+    showAlert(data.message);
+}
+
+async function updateCourse(e, courseId) {
+    e.preventDefault();
+    const formData = new FormData(e.target);
+    const res = await fetch(`${API_BASE}/api/courses/${courseId}`, { method: 'PUT', body: formData });
+    const data = await res.json();
+    showAlert(data.message);
+}
+
+async function updateGalleryImage(e, imageId) {
+    e.preventDefault();
+    const formData = new FormData(e.target);
+    const res = await fetch(`${API_BASE}/api/gallery/${imageId}`, { method: 'PUT', body: formData });
+    const data = await res.json();
+    showAlert(data.message);
+    loadGallery();
+}
+
+async function deleteGalleryImage(imageId) {
+    if (!confirm('Are you sure you want to delete this image?')) return;
+    const res = await fetch(`${API_BASE}/api/gallery/${imageId}`, { method: 'DELETE' });
+    const data = await res.json();
+    showAlert(data.message);
+    loadGallery();
+}
+
+async function addGalleryImage(e) {
+    e.preventDefault();
+    const formData = new FormData(e.target);
+    const res = await fetch(`${API_BASE}/api/gallery`, { method: 'POST', body: formData });
+    const data = await res.json();
+    showAlert(data.message);
+    hideAddImageForm();
+    loadGallery();
+}
+
+function showAddImageForm() {
+    document.getElementById('addImageForm').style.display = 'block';
+}
+
+function hideAddImageForm() {
+    document.getElementById('addImageForm').style.display = 'none';
+    document.getElementById('newImageForm').reset();
+}
+
+// Load initial data
+window.addEventListener('load', () => {
+    loadHero();
+    loadAbout();
+    loadMissionVision();
+    loadContact();
+});
@@ -0,0 +1,95 @@
+"""The admin panel page, kept in memory.
+
+admin_panel.html is a small shell; its stylesheet and script live in
+admin_panel.css and admin_panel.js, referenced by their plain names so the
+files also work opened directly. All three are read once, the CSS/JS
+minified and given content-hashed URLs under /admin/assets/, and every body
+gets its ETag and compressed forms up front. Browsers cache the assets for
+good, so a repeat visit only revalidates the shell.
+
+The files are stat()ed at most once every CHECK_SECONDS and reloaded when
+one of them changes, so editing the panel needs no restart. Both happen in
+the threadpool (get()), never on the event loop.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from cache import CachedBody
+from fingerprint import hashed_name, rewrite_references
+from minify import minify_asset, minify_html
+
+PANEL_DIR = Path(__file__).resolve().parent
+SHELL = 'admin_panel.html'
+ASSETS = ('admin_panel.css', 'admin_panel.js')
+ASSET_URL = '/admin/assets'
+# How long a check of the source files holds
+CHECK_SECONDS = 1.0
+
+MEDIA_TYPES = {'.css': 'text/css', '.js': 'text/javascript', '.html': 'text/html'}
+
+
+class LoadedPanel(NamedTuple):
+    # (inode, mtime, size) of every source file when it was loaded
+    stamp: tuple
+    shell: CachedBody
+    # Asset bodies by file name, under both the hashed and the plain name
+    assets: dict
+
+
+class AdminPanel:
+    def __init__(self, directory: Path = PANEL_DIR):
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
+        self._loaded: Optional[LoadedPanel] = None
+        self._checked = 0.0
+
+    def _stamp(self) -> tuple:
+        stamp = []
+        for name in (SHELL, *ASSETS):
+            stat = os.stat(self.directory / name)
+            stamp.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+        return tuple(stamp)
+
+    def _load(self, stamp: tuple) -> LoadedPanel:
+        modified = datetime.fromtimestamp(max(mtime for _, mtime, _ in stamp) // 10**9, tz=timezone.utc)
+        assets, urls = {}, {}
+        for name in ASSETS:
+            path = self.directory / name
+            data = minify_asset(path.suffix, path.read_bytes())
+            body = CachedBody.from_bytes(data, modified, media_type=MEDIA_TYPES[path.suffix])
+            hashed = hashed_name(path, data)
+            assets[name] = assets[hashed] = body
+            urls[name] = f'{ASSET_URL}/{hashed}'
+        html = (self.directory / SHELL).read_text(encoding='utf-8')
+        html = minify_html(rewrite_references(html, urls))
+        shell = CachedBody.from_bytes(html.encode('utf-8'), modified, media_type=MEDIA_TYPES['.html'])
+        return LoadedPanel(stamp, shell, assets)
+
+    def current(self) -> LoadedPanel:
+        """The loaded panel, reloaded first if a source file changed. Blocking."""
+        stamp = self._stamp()
+        loaded = self._loaded
+        if loaded is None or loaded.stamp != stamp:
+            with self._lock:
+                loaded = self._loaded
+                if loaded is None or loaded.stamp != stamp:
+                    loaded = self._loaded = self._load(stamp)
+        self._checked = time.monotonic()
+        return loaded
+
+    async def get(self) -> LoadedPanel:
+        """current() for request handlers: served from memory between checks,
+        and the check (and any reload) runs in the threadpool"""
+        loaded = self._loaded
+        if loaded is not None and time.monotonic() - self._checked < CHECK_SECONDS:
+            return loaded
+        return await run_in_threadpool(self.current)
+
+
+panel = AdminPanel()
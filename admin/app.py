@@ -1,12 +1,14 @@
-from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Form
+from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Form, Request
 from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from pathlib import Path
 import shutil
 from typing import Optional
 from models import *
+from admin_panel import panel
+from static_files import create_static_app
+from publish import publish_once
 
 app = FastAPI(title="NIHOM Admin Panel")
 
@@ -19,13 +21,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount static files
-app.mount("/static", StaticFiles(directory=".."), name="static")
+# Static files: the published site under /static/frontend, uploads under /static/uploads
+app.mount("/static", create_static_app(), name="static")
 
 # Initialize database on startup
 @app.on_event("startup")
 async def startup_event():
     init_db()
+    publish_once()
 
 # ============ API ENDPOINTS ============
 
@@ -255,9 +258,15 @@ async def upload_image(file: UploadFile = File(...)):
 
 # Admin Panel HTML
 @app.get("/admin", response_class=HTMLResponse)
-async def admin_panel():
-    with open("admin_panel.html", "r", encoding="utf-8") as f:
-        return f.read()
+async def admin_panel(request: Request):
+    return (await panel.get()).shell.to_response(request, "no-cache")
+
+@app.get("/admin/assets/{name}")
+async def admin_panel_asset(name: str, request: Request):
+    body = (await panel.get()).assets.get(name)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return body.to_response(request, "no-cache")
 
 # Root redirect
 @app.get("/")
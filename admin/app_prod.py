@@ -1,23 +1,47 @@
 """Production-ready FastAPI application with authentication"""
-from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Form, Request
-from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+import time
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, Body, Depends, HTTPException, Form, Query, Request
+from fastapi.responses import FileResponse, HTMLResponse, ORJSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func
+from starlette.datastructures import MutableHeaders
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from pathlib import Path
-import shutil
 from typing import Optional
 from models import *
-from auth import get_current_user
+from auth import (get_current_user, authenticate, verify_password, hash_password,
+                  create_session_token, set_session_cookie, SESSION_COOKIE)
+from admin_panel import panel
+from cache import Payload, response_cache
+from compression import CompressionMiddleware
+from fingerprint import is_fingerprinted
+from logging_setup import RequestLogMiddleware, setup_logging
+from metrics import MetricsMiddleware, collect, instrument_engine, render
+from profiling import ProfilingMiddleware, profile_path
+from content import (SECTIONS, parse_sections, load_site_page, load_course,
+                     load_courses_page, load_gallery_image, load_gallery_page)
+from schemas import (HeroContentOut, AboutContentOut, MissionVisionOut, CourseOut,
+                     GalleryImageOut, ContactInfoOut, SiteOut, CourseBatchItem,
+                     GalleryImageBatchItem, BatchResult, MAX_BATCH_ITEMS)
+from batch import update_rows
+from publish import publish
+from imaging import generate_derivatives, shutdown_pool
+from storage import UploadTooLarge, receive_uploads, record_upload, extract_zip
+from startup import initialize
+from static_files import create_static_app
 from config import settings
+import asyncio
+import ipaddress
 import logging
+import zipfile
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging (JSON lines written by a background thread)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
@@ -25,7 +49,8 @@ app = FastAPI(
     description="Content Management System for NIHOM Website",
     version="1.0.0",
     docs_url="/docs" if not settings.PRODUCTION else None,  # Disable docs in production
-    redoc_url="/redoc" if not settings.PRODUCTION else None
+    redoc_url="/redoc" if not settings.PRODUCTION else None,
+    default_response_class=ORJSONResponse
 )
 
 # Security Middleware
@@ -34,33 +59,63 @@ if settings.ENABLE_CORS:
         CORSMiddleware,
         allow_origins=settings.ALLOWED_ORIGINS,
         allow_credentials=True,
-        allow_methods=["GET", "POST", "PUT", "DELETE"],
+        allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE"],
         allow_headers=["*"],
+        expose_headers=["Link", "X-Next-Cursor", "X-Next-Cursor-Courses", "X-Next-Cursor-Gallery",
+                        "X-Profile-Id", "X-Request-ID"],
     )
 
 # Add security headers
-@app.middleware("http")
-async def add_security_headers(request: Request, call_next):
-    response = await call_next(request)
-    response.headers["X-Content-Type-Options"] = "nosniff"
-    response.headers["X-Frame-Options"] = "DENY"
-    response.headers["X-XSS-Protection"] = "1; mode=block"
-    if settings.PRODUCTION:
-        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-    return response
-
-# Mount static files
-try:
-    app.mount("/static", StaticFiles(directory=".."), name="static")
-except Exception as e:
-    logger.warning(f"Could not mount static files: {e}")
-
-# Initialize database on startup
+# (plain ASGI rather than @app.middleware, which cannot pass on zero-copy file sends)
+class SecurityHeadersMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                headers["X-Content-Type-Options"] = "nosniff"
+                headers["X-Frame-Options"] = "DENY"
+                headers["X-XSS-Protection"] = "1; mode=block"
+                if settings.PRODUCTION:
+                    headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+app.add_middleware(SecurityHeadersMiddleware)
+
+app.add_middleware(CompressionMiddleware)
+
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+# Request ids and access lines, around everything but the metrics
+app.add_middleware(RequestLogMiddleware)
+
+# Outermost, so the recorded latency covers every other middleware
+if settings.METRICS_ENABLED:
+    instrument_engine(engine)
+    instrument_engine(async_engine.sync_engine)
+    app.add_middleware(MetricsMiddleware)
+
+# Static files: the published site under /static/frontend, uploads under /static/uploads
+app.mount("/static", create_static_app(), name="static")
+
+# Initialize database on startup (already done if gunicorn preloaded the app)
 @app.on_event("startup")
 async def startup_event():
-    logger.info("Initializing database...")
-    init_db()
-    logger.info("Application started successfully")
+    initialize(IMPORT_STARTED)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    shutdown_pool()
+    await async_engine.dispose()
 
 # ============ PUBLIC ENDPOINTS (No Auth) ============
 
@@ -73,54 +128,164 @@ async def root():
     }
 
 # Public read-only endpoints for website
-@app.get("/api/public/hero")
-def get_hero_public(db: Session = Depends(get_db)):
+# Bodies are served from the response cache; the database is only hit on a miss,
+# through the async session so no threadpool slot is held while it runs
+async def cached_public_response(request: Request, db: AsyncSession, key: str, build, sections=None) -> Response:
+    async def load():
+        return await db.run_sync(build)
+    body = await response_cache.get_or_build_async(key, sections or (key,), load)
+    return body.to_response(request, settings.PUBLIC_CACHE_CONTROL)
+
+def section_or_404(name: str, detail: str):
+    def build(db: Session):
+        data = SECTIONS[name](db)
+        if not data:
+            raise HTTPException(status_code=404, detail=detail)
+        return data
+    return build
+
+# Listings are paginated by cursor: the body stays a plain list and the cursor
+# of the next page, if any, is sent in the Link and X-Next-Cursor headers
+PAGE_LIMIT = Query(None, ge=1, le=settings.MAX_PAGE_SIZE, description="Page size")
+PAGE_AFTER = Query(None, description="Cursor from the X-Next-Cursor header of the previous page")
+
+def page_payload(request: Request, page, limit: int) -> Payload:
+    headers = {}
+    if page.next_cursor:
+        next_url = request.url.include_query_params(limit=limit, after=page.next_cursor)
+        headers["Link"] = f'<{next_url.path}?{next_url.query}>; rel="next"'
+        headers["X-Next-Cursor"] = page.next_cursor
+    return Payload(page.items, headers)
+
+def paginated(request: Request, loader, limit: Optional[int], after: Optional[str], **kwargs):
+    """A build function for one page of loader, as a Payload carrying the next-page headers"""
+    limit = limit or settings.PAGE_SIZE
+    def build(db: Session):
+        try:
+            page = loader(db, limit, after, **kwargs)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return page_payload(request, page, limit)
+    return build
+
+@app.get("/api/public/hero", response_model=HeroContentOut)
+async def get_hero_public(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Public endpoint for hero content"""
-    hero = db.query(HeroContent).first()
-    if not hero:
-        raise HTTPException(status_code=404, detail="Hero content not found")
-    return hero
+    return await cached_public_response(request, db, "hero", section_or_404("hero", "Hero content not found"))
 
-@app.get("/api/public/about")
-def get_about_public(db: Session = Depends(get_db)):
+@app.get("/api/public/about", response_model=AboutContentOut)
+async def get_about_public(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Public endpoint for about content"""
-    about = db.query(AboutContent).first()
-    if not about:
-        raise HTTPException(status_code=404, detail="About content not found")
-    return about
+    return await cached_public_response(request, db, "about", section_or_404("about", "About content not found"))
 
-@app.get("/api/public/mission-vision")
-def get_mission_vision_public(db: Session = Depends(get_db)):
+@app.get("/api/public/mission-vision", response_model=MissionVisionOut)
+async def get_mission_vision_public(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Public endpoint for mission/vision"""
-    mv = db.query(MissionVision).first()
-    if not mv:
-        raise HTTPException(status_code=404, detail="Mission/Vision not found")
-    return mv
+    return await cached_public_response(request, db, "mission-vision", section_or_404("mission-vision", "Mission/Vision not found"))
 
-@app.get("/api/public/courses")
-def get_courses_public(db: Session = Depends(get_db)):
+@app.get("/api/public/courses", response_model=list[CourseOut])
+async def get_courses_public(request: Request, db: AsyncSession = Depends(get_async_db),
+                             limit: Optional[int] = PAGE_LIMIT, after: Optional[str] = PAGE_AFTER):
     """Public endpoint for active courses"""
-    return db.query(Course).filter(Course.is_active == True).order_by(Course.display_order).all()
+    key = f"courses:{limit or settings.PAGE_SIZE}:{after or ''}"
+    return await cached_public_response(request, db, key, paginated(request, load_courses_page, limit, after),
+                                        sections=("courses",))
 
-@app.get("/api/public/gallery")
-def get_gallery_public(db: Session = Depends(get_db)):
+@app.get("/api/public/gallery", response_model=list[GalleryImageOut])
+async def get_gallery_public(request: Request, db: AsyncSession = Depends(get_async_db),
+                             limit: Optional[int] = PAGE_LIMIT, after: Optional[str] = PAGE_AFTER):
     """Public endpoint for active gallery images"""
-    return db.query(GalleryImage).filter(GalleryImage.is_active == True).order_by(GalleryImage.display_order).all()
+    key = f"gallery:{limit or settings.PAGE_SIZE}:{after or ''}"
+    return await cached_public_response(request, db, key, paginated(request, load_gallery_page, limit, after),
+                                        sections=("gallery",))
 
-@app.get("/api/public/contact")
-def get_contact_public(db: Session = Depends(get_db)):
+@app.get("/api/public/contact", response_model=ContactInfoOut)
+async def get_contact_public(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Public endpoint for contact info"""
-    contact = db.query(ContactInfo).first()
-    if not contact:
-        raise HTTPException(status_code=404, detail="Contact info not found")
-    return contact
+    return await cached_public_response(request, db, "contact", section_or_404("contact", "Contact info not found"))
+
+def site_payload(request: Request, names: list, limit: int):
+    """A build function for the site bundle; each listing holds its first page only"""
+    listings = request.url.path.rsplit("/", 1)[0]
+    def build(db: Session):
+        site, cursors = load_site_page(db, names, limit)
+        headers, links = {}, []
+        for name, cursor in cursors.items():
+            links.append(f'<{listings}/{name}?limit={limit}&after={cursor}>; rel="next"; anchor="#{name}"')
+            headers[f"X-Next-Cursor-{name.capitalize()}"] = cursor
+        if links:
+            headers["Link"] = ", ".join(links)
+        return Payload(site, headers)
+    return build
+
+@app.get("/api/public/site", response_model=SiteOut)
+async def get_site_public(request: Request, db: AsyncSession = Depends(get_async_db), sections: Optional[str] = None,
+                          fields: Optional[str] = None, limit: Optional[int] = PAGE_LIMIT):
+    """Public endpoint returning several sections in one response.
+
+    `sections` (or its alias `fields`) is a comma separated list such as
+    `hero,courses`; all sections are returned when it is omitted. Courses
+    and gallery hold their first `limit` rows; the rest is paged through
+    their own endpoints, starting from the X-Next-Cursor-Courses and
+    X-Next-Cursor-Gallery headers.
+    """
+    try:
+        names = parse_sections(sections or fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    limit = limit or settings.PAGE_SIZE
+    key = f"site:{','.join(names)}:{limit}"
+    return await cached_public_response(request, db, key, site_payload(request, names, limit), sections=names)
 
 # ============ PROTECTED ADMIN ENDPOINTS ============
 
+# Sessions
+@app.post("/api/login")
+def login(
+    response: Response,
+    username: str = Form(...),
+    password: str = Form(...),
+    db: Session = Depends(get_db)
+):
+    """Verify the password once and issue a session token"""
+    user = authenticate(db, username, password)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    token = create_session_token(user)
+    set_session_cookie(response, token)
+    logger.info(f"Admin {user.username} logged in")
+    return {"access_token": token, "token_type": "bearer", "expires_in": settings.SESSION_TTL_SECONDS}
+
+@app.post("/api/logout")
+def logout(response: Response):
+    response.delete_cookie(SESSION_COOKIE)
+    return {"message": "Logged out"}
+
+@app.put("/api/password")
+def change_password(
+    response: Response,
+    current_password: str = Form(...),
+    new_password: str = Form(...),
+    db: Session = Depends(get_write_db),
+    current_user=Depends(get_current_user)
+):
+    """Change the password; every session token issued before is revoked"""
+    if not verify_password(current_password, current_user.password):
+        raise HTTPException(status_code=400, detail="Current password is incorrect")
+    if len(new_password) < 8:
+        raise HTTPException(status_code=400, detail="New password must be at least 8 characters")
+    password = hash_password(new_password)
+    db.add(current_user)
+    current_user.password = password
+    db.commit()
+    set_session_cookie(response, create_session_token(current_user))
+    logger.info(f"Password changed by {current_user.username}")
+    return {"message": "Password changed successfully"}
+
 # Hero Content
-@app.get("/api/hero")
+@app.get("/api/hero", response_model=HeroContentOut)
 def get_hero(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    hero = db.query(HeroContent).first()
+    hero = SECTIONS["hero"](db)
     if not hero:
         raise HTTPException(status_code=404, detail="Hero content not found")
     return hero
@@ -137,7 +302,7 @@ def update_hero(
     stat_students: int = Form(...),
     stat_programs: int = Form(...),
     stat_faculty: int = Form(...),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     current_user=Depends(get_current_user)
 ):
     hero = db.query(HeroContent).first()
@@ -153,14 +318,15 @@ def update_hero(
         hero.stat_programs = stat_programs
         hero.stat_faculty = stat_faculty
         db.commit()
+        response_cache.invalidate("hero")
         logger.info(f"Hero content updated by {current_user.username}")
         return {"message": "Hero content updated successfully"}
     raise HTTPException(status_code=404, detail="Hero content not found")
 
 # About Content
-@app.get("/api/about")
+@app.get("/api/about", response_model=AboutContentOut)
 def get_about(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    about = db.query(AboutContent).first()
+    about = SECTIONS["about"](db)
     if not about:
         raise HTTPException(status_code=404, detail="About content not found")
     return about
@@ -173,7 +339,7 @@ def update_about(
     paragraph1: str = Form(...),
     paragraph2: str = Form(...),
     paragraph3: str = Form(...),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     current_user=Depends(get_current_user)
 ):
     about = db.query(AboutContent).first()
@@ -185,14 +351,15 @@ def update_about(
         about.paragraph2 = paragraph2
         about.paragraph3 = paragraph3
         db.commit()
+        response_cache.invalidate("about")
         logger.info(f"About content updated by {current_user.username}")
         return {"message": "About content updated successfully"}
     raise HTTPException(status_code=404, detail="About content not found")
 
 # Mission & Vision
-@app.get("/api/mission-vision")
+@app.get("/api/mission-vision", response_model=MissionVisionOut)
 def get_mission_vision(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    mv = db.query(MissionVision).first()
+    mv = SECTIONS["mission-vision"](db)
     if not mv:
         raise HTTPException(status_code=404, detail="Mission/Vision not found")
     return mv
@@ -201,7 +368,7 @@ def get_mission_vision(db: Session = Depends(get_db), current_user=Depends(get_c
 def update_mission_vision(
     mission_text: str = Form(...),
     vision_text: str = Form(...),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     current_user=Depends(get_current_user)
 ):
     mv = db.query(MissionVision).first()
@@ -209,18 +376,23 @@ def update_mission_vision(
         mv.mission_text = mission_text
         mv.vision_text = vision_text
         db.commit()
+        response_cache.invalidate("mission-vision")
         logger.info(f"Mission/Vision updated by {current_user.username}")
         return {"message": "Mission & Vision updated successfully"}
     raise HTTPException(status_code=404, detail="Mission/Vision not found")
 
 # Courses
-@app.get("/api/courses")
-def get_courses(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    return db.query(Course).order_by(Course.display_order).all()
-
-@app.get("/api/courses/{course_id}")
+@app.get("/api/courses", response_model=list[CourseOut])
+def get_courses(request: Request, response: Response, limit: Optional[int] = PAGE_LIMIT,
+                after: Optional[str] = PAGE_AFTER, db: Session = Depends(get_db),
+                current_user=Depends(get_current_user)):
+    page = paginated(request, load_courses_page, limit, after, active_only=False)(db)
+    response.headers.update(page.headers)
+    return page.data
+
+@app.get("/api/courses/{course_id}", response_model=CourseOut)
 def get_course(course_id: int, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    course = db.query(Course).filter(Course.id == course_id).first()
+    course = load_course(db, course_id)
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
     return course
@@ -233,7 +405,7 @@ def update_course(
     image_url: str = Form(...),
     is_active: bool = Form(True),
     display_order: int = Form(0),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     current_user=Depends(get_current_user)
 ):
     course = db.query(Course).filter(Course.id == course_id).first()
@@ -244,18 +416,36 @@ def update_course(
         course.is_active = is_active
         course.display_order = display_order
         db.commit()
+        response_cache.invalidate("courses")
         logger.info(f"Course {course_id} updated by {current_user.username}")
         return {"message": "Course updated successfully"}
     raise HTTPException(status_code=404, detail="Course not found")
 
-# Gallery
-@app.get("/api/gallery")
-def get_gallery(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    return db.query(GalleryImage).order_by(GalleryImage.display_order).all()
+@app.patch("/api/courses", response_model=BatchResult)
+def update_courses(
+    items: list[CourseBatchItem] = Body(..., max_length=MAX_BATCH_ITEMS),
+    db: Session = Depends(get_write_db),
+    current_user=Depends(get_current_user)
+):
+    """Update many courses (e.g. a new display order) in one transaction"""
+    result = update_rows(db, Course, items)
+    if result["updated"]:
+        response_cache.invalidate("courses")
+        logger.info(f"{result['updated']} courses updated by {current_user.username}")
+    return result
 
-@app.get("/api/gallery/{image_id}")
+# Gallery
+@app.get("/api/gallery", response_model=list[GalleryImageOut])
+def get_gallery(request: Request, response: Response, limit: Optional[int] = PAGE_LIMIT,
+                after: Optional[str] = PAGE_AFTER, db: Session = Depends(get_db),
+                current_user=Depends(get_current_user)):
+    page = paginated(request, load_gallery_page, limit, after, active_only=False)(db)
+    response.headers.update(page.headers)
+    return page.data
+
+@app.get("/api/gallery/{image_id}", response_model=GalleryImageOut)
 def get_gallery_image(image_id: int, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    image = db.query(GalleryImage).filter(GalleryImage.id == image_id).first()
+    image = load_gallery_image(db, image_id)
     if not image:
         raise HTTPException(status_code=404, detail="Image not found")
     return image
@@ -268,7 +458,7 @@ def update_gallery_image(
     caption: str = Form(""),
     is_active: bool = Form(True),
     display_order: int = Form(0),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     current_user=Depends(get_current_user)
 ):
     image = db.query(GalleryImage).filter(GalleryImage.id == image_id).first()
@@ -279,16 +469,31 @@ def update_gallery_image(
         image.is_active = is_active
         image.display_order = display_order
         db.commit()
+        response_cache.invalidate("gallery")
         logger.info(f"Gallery image {image_id} updated by {current_user.username}")
         return {"message": "Gallery image updated successfully"}
     raise HTTPException(status_code=404, detail="Image not found")
 
+@app.patch("/api/gallery", response_model=BatchResult)
+def update_gallery(
+    items: list[GalleryImageBatchItem] = Body(..., max_length=MAX_BATCH_ITEMS),
+    db: Session = Depends(get_write_db),
+    current_user=Depends(get_current_user)
+):
+    """Update many gallery images (e.g. a new display order) in one transaction"""
+    result = update_rows(db, GalleryImage, items)
+    if result["updated"]:
+        response_cache.invalidate("gallery")
+        logger.info(f"{result['updated']} gallery images updated by {current_user.username}")
+    return result
+
 @app.delete("/api/gallery/{image_id}")
-def delete_gallery_image(image_id: int, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+def delete_gallery_image(image_id: int, db: Session = Depends(get_write_db), current_user=Depends(get_current_user)):
     image = db.query(GalleryImage).filter(GalleryImage.id == image_id).first()
     if image:
         db.delete(image)
         db.commit()
+        response_cache.invalidate("gallery")
         logger.info(f"Gallery image {image_id} deleted by {current_user.username}")
         return {"message": "Image deleted successfully"}
     raise HTTPException(status_code=404, detail="Image not found")
@@ -299,7 +504,7 @@ def add_gallery_image(
     alt_text: str = Form(...),
     caption: str = Form(""),
     display_order: int = Form(0),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     current_user=Depends(get_current_user)
 ):
     new_image = GalleryImage(
@@ -310,13 +515,14 @@ def add_gallery_image(
     )
     db.add(new_image)
     db.commit()
+    response_cache.invalidate("gallery")
     logger.info(f"Gallery image added by {current_user.username}")
     return {"message": "Gallery image added successfully", "id": new_image.id}
 
 # Contact Info
-@app.get("/api/contact")
+@app.get("/api/contact", response_model=ContactInfoOut)
 def get_contact(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    contact = db.query(ContactInfo).first()
+    contact = SECTIONS["contact"](db)
     if not contact:
         raise HTTPException(status_code=404, detail="Contact info not found")
     return contact
@@ -326,7 +532,7 @@ def update_contact(
     location: str = Form(...),
     email: str = Form(...),
     phone: str = Form(...),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     current_user=Depends(get_current_user)
 ):
     contact = db.query(ContactInfo).first()
@@ -335,38 +541,232 @@ def update_contact(
         contact.email = email
         contact.phone = phone
         db.commit()
+        response_cache.invalidate("contact")
         logger.info(f"Contact info updated by {current_user.username}")
         return {"message": "Contact info updated successfully"}
     raise HTTPException(status_code=404, detail="Contact info not found")
 
 # Image Upload
-@app.post("/api/upload")
-async def upload_image(file: UploadFile = File(...), current_user=Depends(get_current_user)):
+def register_upload(digest: str, path: Path, filename: str, content_type: Optional[str], size: int) -> tuple:
+    """Record an upload's metadata. Returns (url, recorded variants, created)"""
+    db = WriteSessionLocal()
     try:
-        upload_dir = Path("../uploads")
-        upload_dir.mkdir(exist_ok=True)
-
-        file_path = upload_dir / file.filename
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        logger.info(f"File uploaded: {file.filename} by {current_user.username}")
-        return {"filename": file.filename, "url": f"uploads/{file.filename}"}
+        uploaded, created = record_upload(db, digest, path, filename, content_type, size)
+        variants = db.query(ImageVariant).filter(ImageVariant.source_url == uploaded.url).order_by(ImageVariant.width).all()
+        return uploaded.url, [
+            {"url": v.url, "width": v.width, "height": v.height, "format": v.format} for v in variants
+        ], created
+    finally:
+        db.close()
+
+def record_variants(source_url: str, variants: list):
+    db = WriteSessionLocal()
+    try:
+        db.query(ImageVariant).filter(ImageVariant.source_url == source_url).delete()
+        db.add_all(ImageVariant(source_url=source_url, **variant) for variant in variants)
+        db.commit()
+    finally:
+        db.close()
+    # Rows already pointing at this URL now serve the new variants
+    response_cache.invalidate("courses", "gallery")
+
+@app.post("/api/upload", openapi_extra={
+    "requestBody": {"content": {"multipart/form-data": {"schema": {
+        "type": "object", "required": ["file"],
+        "properties": {"file": {"type": "string", "format": "binary"}},
+    }}}, "required": True}
+})
+async def upload_image(request: Request, current_user=Depends(get_current_user)):
+    # The body is streamed to disk as it arrives rather than parsed up front
+    files, _ = await receive_uploads(request, max_files=1)
+    if not files:
+        raise HTTPException(status_code=400, detail="No file uploaded")
+    upload = files[0]
+    try:
+        url, variants, created = await run_in_threadpool(
+            register_upload, upload.sha256, upload.path, upload.filename, upload.content_type, upload.size
+        )
+
+        # Identical content was uploaded before: nothing left to do
+        if created:
+            variants = await generate_derivatives(upload.path)
+            if variants:
+                await run_in_threadpool(record_variants, url, variants)
+
+        logger.info(
+            f"File uploaded: {upload.filename} as {upload.path.name} by {current_user.username} "
+            f"({'new' if created else 'duplicate'}, {len(variants)} derivatives)"
+        )
+        return {"filename": upload.filename, "url": url, "sha256": upload.sha256, "duplicate": not created, "variants": variants}
     except Exception as e:
         logger.error(f"Upload error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-# Admin Panel HTML
+# Bulk gallery import
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+
+def create_gallery_images(files: list, derivatives: list, alt_text: str, caption: str) -> list:
+    """Record the uploads, their variants and one gallery row per new image in one transaction.
+
+    Returns one result dict per file, in order.
+    """
+    db = WriteSessionLocal()
+    try:
+        digests = {f.sha256 for f in files}
+        uploads = {u.sha256: u for u in db.query(UploadedFile).filter(UploadedFile.sha256.in_(digests))}
+        in_gallery = {url for (url,) in db.query(GalleryImage.image_url).filter(
+            GalleryImage.image_url.in_([u.url for u in uploads.values()]))}
+        order = db.query(func.max(GalleryImage.display_order)).scalar() or 0
+
+        results, created = [], []
+        for f, variants in zip(files, derivatives):
+            uploaded = uploads.get(f.sha256)
+            if uploaded is None:
+                uploaded = uploads[f.sha256] = UploadedFile(
+                    sha256=f.sha256, url=f"uploads/{f.path.name}", original_name=f.filename,
+                    content_type=f.content_type, size=f.size,
+                )
+                db.add(uploaded)
+            if variants:
+                db.query(ImageVariant).filter(ImageVariant.source_url == uploaded.url).delete()
+                db.add_all(ImageVariant(source_url=uploaded.url, **variant) for variant in variants)
+            if uploaded.url in in_gallery:
+                results.append({"filename": f.filename, "url": uploaded.url, "status": "duplicate"})
+                continue
+            in_gallery.add(uploaded.url)
+            order += 1
+            row = GalleryImage(
+                image_url=uploaded.url,
+                alt_text=alt_text or Path(f.filename).stem.replace('_', ' ').replace('-', ' '),
+                caption=caption,
+                display_order=order,
+            )
+            result = {"filename": f.filename, "url": uploaded.url, "status": "created"}
+            created.append((result, row))
+            results.append(result)
+        db.add_all(row for _, row in created)
+        db.commit()
+        for result, row in created:
+            result["id"] = row.id
+        return results
+    finally:
+        db.close()
+
+@app.post("/api/gallery/import", openapi_extra={
+    "requestBody": {"content": {"multipart/form-data": {"schema": {
+        "type": "object", "required": ["files"],
+        "properties": {
+            "files": {"type": "array", "items": {"type": "string", "format": "binary"}},
+            "alt_text": {"type": "string"},
+            "caption": {"type": "string"},
+        },
+    }}}, "required": True}
+})
+async def import_gallery(request: Request, current_user=Depends(get_current_user)):
+    """Add many images to the gallery from one request: image files, zip archives or both"""
+    received, fields = await receive_uploads(
+        request,
+        max_files=settings.MAX_IMPORT_FILES,
+        max_size=settings.MAX_IMPORT_BYTES,
+        max_total=settings.MAX_IMPORT_BYTES,
+    )
+    files, skipped = [], []
+    # What the archives may expand to: the whole import stays within MAX_IMPORT_BYTES on disk
+    budget = settings.MAX_IMPORT_BYTES - sum(upload.size for upload in received)
+    for upload in received:
+        if upload.path.suffix == '.zip':
+            try:
+                stored, rejected = await run_in_threadpool(
+                    extract_zip, upload.path, IMAGE_SUFFIXES, settings.MAX_IMPORT_FILES - len(files),
+                    max_total=max(budget, 0),
+                )
+                files += stored
+                skipped += rejected
+                budget -= sum(f.size for f in stored)
+            except zipfile.BadZipFile:
+                skipped.append((upload.filename, "not a valid zip archive"))
+            except UploadTooLarge:
+                for f in (*files, *received):
+                    if f.created:
+                        f.path.unlink(missing_ok=True)
+                raise HTTPException(status_code=413, detail=f"Import exceeds the {settings.MAX_IMPORT_BYTES} byte limit")
+        elif upload.path.suffix not in IMAGE_SUFFIXES:
+            skipped.append((upload.filename, "not an image"))
+        elif upload.size > settings.MAX_UPLOAD_BYTES:
+            skipped.append((upload.filename, "too large"))
+        else:
+            files.append(upload)
+            continue
+        # Only images are kept, not archives or rejected files
+        if upload.created:
+            upload.path.unlink(missing_ok=True)
+    if not files:
+        raise HTTPException(status_code=400, detail="No images to import")
+
+    # Resize every new image at once; the process pool spreads them over the cores
+    derivatives = await asyncio.gather(*(
+        generate_derivatives(f.path) if f.created else asyncio.sleep(0, result=[]) for f in files
+    ))
+    results = await run_in_threadpool(
+        create_gallery_images, files, derivatives, fields.get("alt_text", ""), fields.get("caption", "")
+    )
+    results += [{"filename": name, "status": "skipped", "reason": reason} for name, reason in skipped]
+    created = sum(result["status"] == "created" for result in results)
+    response_cache.invalidate("gallery", "courses")
+    logger.info(f"Gallery import by {current_user.username}: {created} added, {len(results) - created} not added")
+    return {"imported": created, "results": results}
+
+# Static site publishing
+@app.post("/api/publish")
+def publish_site(force: bool = False, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+    """Re-render the static website pages whose content changed"""
+    report = publish(db, force=force)
+    logger.info(f"Site published by {current_user.username}: {len(report['rendered'])} pages rendered")
+    return report
+
+# Request profiles recorded by ProfilingMiddleware
+@app.get("/api/profiles/{profile_id}", include_in_schema=False)
+def download_profile(profile_id: str, current_user=Depends(get_current_user)):
+    path = profile_path(profile_id)
+    if path is None or not path.is_file():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/json", filename=f"profile-{profile_id}.json",
+                        headers={"Cache-Control": "private, no-store"})
+
+# Admin Panel HTML, served from memory; it must be revalidated, its assets never
+ADMIN_CACHE_CONTROL = "private, no-cache"
+
 @app.get("/admin", response_class=HTMLResponse, include_in_schema=False)
-async def admin_panel(current_user=Depends(get_current_user)):
-    with open("admin_panel.html", "r", encoding="utf-8") as f:
-        return f.read()
+async def admin_panel(request: Request, current_user=Depends(get_current_user)):
+    return (await panel.get()).shell.to_response(request, ADMIN_CACHE_CONTROL)
+
+@app.get("/admin/assets/{name}", include_in_schema=False)
+async def admin_panel_asset(name: str, request: Request):
+    body = (await panel.get()).assets.get(name)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    cache_control = settings.ASSET_CACHE_CONTROL if is_fingerprinted(name) else "no-cache"
+    return body.to_response(request, cache_control)
 
 # Health check
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "version": "1.0.0"}
 
+# Prometheus metrics of all workers; only for scrapers on the same host
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    if not settings.METRICS_ENABLED or not is_local_client(request):
+        raise HTTPException(status_code=404, detail="Not Found")
+    text = await run_in_threadpool(lambda: render(collect()))
+    return Response(content=text, media_type="text/plain; version=0.0.4")
+
+def is_local_client(request: Request) -> bool:
+    try:
+        return ipaddress.ip_address(request.client.host).is_loopback
+    except (AttributeError, ValueError):
+        return False
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
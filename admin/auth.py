@@ -1,38 +1,142 @@
 """Authentication and security utilities for production"""
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, Response, status
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from sqlalchemy.orm import Session
+from typing import Optional
+import base64
 import bcrypt
+import hashlib
+import hmac
 import secrets
+import time
+from config import settings
+from logging_setup import set_user
+from metrics import timed
 from models import get_db, AdminUser
 
-security = HTTPBasic()
+security = HTTPBasic(auto_error=False)
+
+SESSION_COOKIE = "nihom_session"
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    with timed('nihom_password_verify_seconds'):
+        return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+def _sign(payload: str) -> str:
+    digest = hmac.new(settings.SECRET_KEY.encode('utf-8'), payload.encode('utf-8'), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+
+def password_fingerprint(hashed_password: str) -> str:
+    """Short keyed digest of the stored hash; changes whenever the password does"""
+    return _sign(hashed_password)[:16]
+
+def create_session_token(user: AdminUser, ttl: int = None) -> str:
+    """Issue a signed, expiring session token for user.
+
+    The token is `<user id>.<expiry>.<password fingerprint>.<signature>`, so
+    it stops validating as soon as the password changes.
+    """
+    expires = int(time.time()) + (ttl or settings.SESSION_TTL_SECONDS)
+    payload = f"{user.id}.{expires}.{password_fingerprint(user.password)}"
+    return f"{payload}.{_sign(payload)}"
+
+def verify_session_token(token: str) -> Optional[tuple]:
+    """Return (user_id, password fingerprint) for a valid, unexpired token"""
+    try:
+        user_id, expires, fingerprint, signature = token.split(".")
+        if not hmac.compare_digest(signature, _sign(f"{user_id}.{expires}.{fingerprint}")):
+            return None
+        if int(expires) < time.time():
+            return None
+        return int(user_id), fingerprint
+    except ValueError:
+        return None
+
+def set_session_cookie(response: Response, token: str):
+    response.set_cookie(
+        SESSION_COOKIE,
+        token,
+        max_age=settings.SESSION_TTL_SECONDS,
+        httponly=True,
+        secure=settings.PRODUCTION,
+        samesite="strict",
+    )
+
+def session_token(request: Request) -> Optional[str]:
+    """The session token from the Bearer header or the session cookie"""
+    authorization = request.headers.get("authorization", "")
+    scheme, _, value = authorization.partition(" ")
+    if scheme.lower() == "bearer" and value:
+        return value
+    return request.cookies.get(SESSION_COOKIE)
+
+def _unauthorized():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid credentials",
+        headers={"WWW-Authenticate": "Basic"},
+    )
+
+def session_user(db: Session, token: str) -> Optional[AdminUser]:
+    """The user a session token belongs to, if it is valid and their password unchanged"""
+    claims = verify_session_token(token)
+    if not claims:
+        return None
+    user_id, fingerprint = claims
+    user = _detached(db, db.get(AdminUser, user_id))
+    if user and hmac.compare_digest(fingerprint, password_fingerprint(user.password)):
+        return user
+    return None
+
+def authenticate(db: Session, username: str, password: str) -> Optional[AdminUser]:
+    """Check a username/password pair with bcrypt"""
+    user = _detached(db, db.query(AdminUser).filter(AdminUser.username == username).first())
+    if not user or not verify_password(password, user.password):
+        return None
+    return user
+
+def _detached(db: Session, user: Optional[AdminUser]) -> Optional[AdminUser]:
+    """Hand out the user without keeping the lookup's transaction open.
+
+    The lookup's read snapshot is not held over bcrypt or the rest of the
+    request, and endpoints that write can attach the user to their own
+    session (get_write_db): call db.add(user) before changing it.
+    """
+    if user is not None:
+        db.expunge(user)
+    db.rollback()
+    return user
 
 def get_current_user(
-    credentials: HTTPBasicCredentials = Depends(security),
+    request: Request,
+    response: Response,
+    credentials: Optional[HTTPBasicCredentials] = Depends(security),
     db: Session = Depends(get_db)
 ):
-    """Verify user credentials and return user if valid"""
-    user = db.query(AdminUser).filter(AdminUser.username == credentials.username).first()
+    """Return the authenticated user.
+
+    A session token (Bearer header or session cookie) is checked first and
+    costs one HMAC plus a primary key lookup. HTTP Basic credentials still
+    work but go through bcrypt, so a successful Basic login also sets the
+    session cookie to keep the following requests off that path.
+    """
+    token = session_token(request)
+    if token:
+        user = session_user(db, token)
+        if user:
+            set_user(user.username)
+            return user
+
+    if credentials is None:
+        raise _unauthorized()
 
+    user = authenticate(db, credentials.username, credentials.password)
     if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid credentials",
-            headers={"WWW-Authenticate": "Basic"},
-        )
-
-    if not verify_password(credentials.password, user.password):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid credentials",
-            headers={"WWW-Authenticate": "Basic"},
-        )
+        raise _unauthorized()
 
+    set_user(user.username)
+    set_session_cookie(response, create_session_token(user))
     return user
 
 def hash_password(password: str) -> str:
@@ -0,0 +1,60 @@
+"""Apply many partial row updates in a single transaction.
+
+Reordering the gallery used to cost one request and one commit per image;
+update_rows validates the whole batch up front, checks which ids exist with
+one SELECT and writes every change with a single UPDATE statement.
+"""
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import case, select, update
+from sqlalchemy.orm import Session
+
+
+def update_rows(db: Session, model, items: list) -> dict:
+    """Apply the batch items (pydantic models with an id) to model's table.
+
+    Fields that are omitted or null are left unchanged. Ids that do not
+    exist are reported as not_found and skipped; everything else is
+    committed together or, on error, not at all. Returns a BatchResult dict.
+    """
+    ids = [item.id for item in items]
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=422, detail="Each id may appear only once per batch")
+
+    existing = set(db.scalars(select(model.id).where(model.id.in_(ids)))) if ids else set()
+    now = datetime.utcnow()
+    changes, results = {}, []
+    for item in items:
+        values = item.model_dump(exclude_unset=True, exclude_none=True, exclude={'id'})
+        if item.id not in existing:
+            results.append({'id': item.id, 'status': 'not_found'})
+        elif not values:
+            results.append({'id': item.id, 'status': 'unchanged'})
+        else:
+            changes[item.id] = values
+            results.append({'id': item.id, 'status': 'updated'})
+
+    if changes:
+        # One statement for the whole batch: every touched column becomes
+        # CASE id WHEN ... THEN <new value> ELSE <current value> END
+        columns = {name for values in changes.values() for name in values}
+        assignments = {
+            name: case(
+                {row_id: values[name] for row_id, values in changes.items() if name in values},
+                value=model.id,
+                else_=getattr(model, name),
+            )
+            for name in sorted(columns)
+        }
+        statement = (update(model)
+                     .where(model.id.in_(changes))
+                     .values(**assignments, updated_at=now)
+                     .execution_options(synchronize_session=False))
+        try:
+            db.execute(statement)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    return {'updated': len(changes), 'results': results}
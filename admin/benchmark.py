@@ -0,0 +1,420 @@
+"""Load test and micro-benchmarks for the admin API.
+
+Every run builds its own database, uploads and site directories in a
+temporary directory, with fixed data, so runs are comparable. The app is
+driven either in-process over an ASGI transport (no network, measures the
+application alone) or through a local uvicorn/gunicorn server started for
+the run.
+
+Scenarios: the public read endpoints, admin reads with a session token,
+login (one bcrypt check per request), updates, uploads, and the gallery
+listings with 10, 1,000 and 10,000 images. Each scenario reports p50, p95
+and p99 latency and throughput.
+
+Only responses with the expected status count towards latency and
+throughput; any other is an error, and a run with errors exits with status 1
+and cannot be saved as a baseline. Results can be stored as a baseline per
+mode and later runs compared with it; a scenario whose p95 or throughput is
+worse by more than the threshold is flagged and the exit status is 1. Baselines only mean something on the
+machine they were recorded on.
+
+Usage:
+    python benchmark.py                                   # in-process
+    python benchmark.py --server uvicorn
+    python benchmark.py --server gunicorn --workers 2
+    python benchmark.py --only gallery --sizes 10,10000
+    python benchmark.py --save-baseline                   # record
+    python benchmark.py --compare                         # check against it
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, NamedTuple
+
+import httpx
+
+BASELINE_FILE = Path(__file__).resolve().parent / 'benchmark-baseline.json'
+PASSWORD = 'benchmark-password'
+GALLERY_SIZES = (10, 1000, 10000)
+
+
+class Scenario(NamedTuple):
+    name: str
+    # call(client, request number, headers) sends the request(s) and returns the final response
+    call: Callable[[httpx.AsyncClient, int, dict], Awaitable[httpx.Response]]
+    authenticated: bool = False
+    expected_status: int = 200
+
+
+class Result(NamedTuple):
+    name: str
+    requests: int
+    # Responses other than the expected status; not part of the latency or throughput figures
+    errors: int
+    p50: float
+    p95: float
+    p99: float
+    throughput: float
+
+    def row(self) -> tuple:
+        return (self.name, str(self.requests), str(self.errors), f"{self.p50 * 1000:.2f}",
+                f"{self.p95 * 1000:.2f}", f"{self.p99 * 1000:.2f}", f"{self.throughput:.0f}")
+
+
+# ---- Environment and data ----
+
+def configure_environment(work_dir: Path) -> dict:
+    """Point the app at throwaway storage; must run before the app modules are imported"""
+    env = {
+        'DATABASE_URL': f"sqlite:///{work_dir / 'benchmark.db'}",
+        'UPLOAD_DIR': str(work_dir / 'uploads'),
+        'PUBLISH_DIR': str(work_dir / 'site'),
+        'METRICS_DIR': str(work_dir / 'metrics'),
+        'CACHE_REVISION_FILE': str(work_dir / '.content-revision'),
+        'SECRET_KEY': 'benchmark-secret-key',
+        'AUTO_MIGRATE': 'true',
+        'PRODUCTION': 'false',
+        # One access line per request would bury the results
+        'LOG_LEVEL': 'WARNING',
+    }
+    os.environ.update(env)
+    (work_dir / 'site').mkdir(parents=True, exist_ok=True)
+    return env
+
+
+def prepare_database():
+    from auth import hash_password
+    from models import AdminUser, SessionLocal, init_db
+    init_db()
+    db = SessionLocal()
+    try:
+        db.query(AdminUser).update({AdminUser.password: hash_password(PASSWORD)})
+        db.commit()
+    finally:
+        db.close()
+
+
+def resize_gallery(rows: int):
+    """Make the gallery hold exactly rows images"""
+    from cache import response_cache
+    from models import GalleryImage, SessionLocal
+    db = SessionLocal()
+    try:
+        count = db.query(GalleryImage).count()
+        if count < rows:
+            db.bulk_insert_mappings(GalleryImage, [
+                {'image_url': f'uploads/benchmark-{i}.jpg', 'alt_text': f'Benchmark image {i}',
+                 'caption': f'Caption {i}', 'display_order': i, 'is_active': True}
+                for i in range(count, rows)
+            ])
+        elif count > rows:
+            extra = db.query(GalleryImage.id).order_by(GalleryImage.id.desc()).limit(count - rows).subquery()
+            db.query(GalleryImage).filter(GalleryImage.id.in_(extra.select())).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+    # Also reaches the server processes through the shared revision file
+    response_cache.invalidate('gallery')
+
+
+def png(n: int) -> bytes:
+    """A small PNG unique to n, so every upload is stored rather than deduplicated"""
+    from PIL import Image
+    image = Image.new('RGB', (64, 64), (n % 256, (n // 256) % 256, (n // 65536) % 256))
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+# ---- Scenarios ----
+
+HERO_FORM = {
+    'badge_text': 'Since 2026', 'title_line1': 'Navy Institute of', 'title_line2': 'Hospitality Management',
+    'subtitle_word1': 'Excellence', 'subtitle_word2': 'in Culinary Arts',
+    'subtitle_word3': '& Hospitality Education', 'description': 'Benchmark run',
+    'stat_students': '500', 'stat_programs': '3', 'stat_faculty': '50',
+}
+
+
+def send(method: str, path: str, options: Callable[[int], dict] = lambda n: {}):
+    """A scenario call making one request; options(n) gives its httpx arguments"""
+    async def call(client: httpx.AsyncClient, n: int, headers: dict) -> httpx.Response:
+        return await client.request(method, path, headers=headers, **options(n))
+    return call
+
+
+def all_pages(path: str):
+    """A scenario call following X-Next-Cursor to the end, as the admin panel does"""
+    async def call(client: httpx.AsyncClient, n: int, headers: dict) -> httpx.Response:
+        cursor = None
+        while True:
+            params = {'limit': 200, **({'after': cursor} if cursor else {})}
+            response = await client.get(path, params=params, headers=headers)
+            cursor = response.headers.get('x-next-cursor')
+            if response.status_code != 200 or not cursor:
+                return response
+    return call
+
+
+def base_scenarios(upload_offset: int) -> list:
+    return [
+        Scenario('public hero', send('GET', '/api/public/hero')),
+        Scenario('public site', send('GET', '/api/public/site')),
+        Scenario('public courses', send('GET', '/api/public/courses')),
+        Scenario('admin hero (session)', send('GET', '/api/hero'), authenticated=True),
+        Scenario('admin courses (session)', send('GET', '/api/courses'), authenticated=True),
+        Scenario('login (bcrypt)', send('POST', '/api/login', lambda n: {
+            'data': {'username': 'admin', 'password': PASSWORD}})),
+        Scenario('update hero', send('PUT', '/api/hero', lambda n: {'data': HERO_FORM}), authenticated=True),
+        Scenario('batch update courses', send('PATCH', '/api/courses', lambda n: {
+            'json': [{'id': 1, 'display_order': n % 3 + 1}, {'id': 2, 'title': f'Course {n}'}]}), authenticated=True),
+        Scenario('upload image', send('POST', '/api/upload', lambda n: {
+            'files': {'file': (f'{n}.png', png(upload_offset + n), 'image/png')}}), authenticated=True),
+    ]
+
+
+def gallery_scenarios(rows: int) -> list:
+    return [
+        Scenario(f'public gallery first page ({rows})', send('GET', '/api/public/gallery', lambda n: {
+            'params': {'limit': 50}})),
+        Scenario(f'admin gallery first page ({rows})', send('GET', '/api/gallery', lambda n: {
+            'params': {'limit': 200}}), authenticated=True),
+        Scenario(f'admin gallery all pages ({rows})', all_pages('/api/gallery'), authenticated=True),
+    ]
+
+
+# ---- Running ----
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, requests: int, concurrency: int,
+                       warmup: int, token: str) -> Result:
+    headers = {'Authorization': f'Bearer {token}'} if scenario.authenticated else {}
+    counter = iter(range(warmup + requests))
+    timings, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        for n in counter:
+            started = time.perf_counter()
+            response = await scenario.call(client, n, headers)
+            if n < warmup:
+                continue
+            if response.status_code == scenario.expected_status:
+                timings.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    # Warm-up requests are the first ones handed out, so caches are hot before timing counts
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    timings.sort()
+    return Result(scenario.name, len(timings) + errors, errors, percentile(timings, 0.50), percentile(timings, 0.95),
+                  percentile(timings, 0.99), len(timings) / elapsed if elapsed else 0.0)
+
+
+async def login(client: httpx.AsyncClient) -> str:
+    response = await client.post('/api/login', data={'username': 'admin', 'password': PASSWORD})
+    response.raise_for_status()
+    client.cookies.clear()  # authenticate with the header only, like an API client
+    return response.json()['access_token']
+
+
+async def run_suite(client: httpx.AsyncClient, args) -> list:
+    token = await login(client)
+    wanted = lambda s: not args.only or any(part.lower() in s.name.lower() for part in args.only.split(','))
+    results = []
+    for scenario in filter(wanted, base_scenarios(upload_offset=int(time.time()))):
+        results.append(await run_scenario(client, scenario, args.requests, args.concurrency, args.warmup, token))
+        print_progress(results[-1])
+    for rows in args.sizes:
+        selected = list(filter(wanted, gallery_scenarios(rows)))
+        if not selected:
+            continue
+        resize_gallery(rows)
+        for scenario in selected:
+            results.append(await run_scenario(client, scenario, args.requests, args.concurrency, args.warmup, token))
+            print_progress(results[-1])
+    return results
+
+
+def print_progress(result: Result):
+    print(f"  {result.name}: p95 {result.p95 * 1000:.2f} ms, {result.throughput:.0f} req/s", file=sys.stderr)
+
+
+async def run_in_process(args) -> list:
+    import app_prod
+    await app_prod.app.router.startup()
+    try:
+        # Unhandled errors become 500s and count as errors, as they would over the network
+        transport = httpx.ASGITransport(app=app_prod.app, raise_app_exceptions=False, client=('127.0.0.1', 50000))
+        async with httpx.AsyncClient(transport=transport, base_url='http://benchmark') as client:
+            return await run_suite(client, args)
+    finally:
+        await app_prod.app.router.shutdown()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def server_command(args, port: int) -> list:
+    if args.server == 'gunicorn':
+        return [sys.executable, '-m', 'gunicorn', 'app_prod:app', '--workers', str(args.workers),
+                '--worker-class', 'uvicorn.workers.UvicornWorker', '--bind', f'127.0.0.1:{port}']
+    return [sys.executable, '-m', 'uvicorn', 'app_prod:app', '--host', '127.0.0.1', '--port', str(port),
+            '--workers', str(args.workers), '--log-level', 'warning']
+
+
+async def run_against_server(args) -> list:
+    port = free_port()
+    log = open(args.work_dir / 'server.log', 'wb')
+    server = subprocess.Popen(server_command(args, port), cwd=Path(__file__).resolve().parent,
+                              env=os.environ.copy(), stdout=log, stderr=subprocess.STDOUT)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            for _ in range(100):
+                if server.poll() is not None:
+                    sys.stderr.write((args.work_dir / 'server.log').read_text(errors='replace'))
+                    raise SystemExit(f"{args.server} exited with status {server.returncode}")
+                try:
+                    await client.get('/health')
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            else:
+                raise SystemExit(f"{args.server} did not start listening on {base_url}")
+            return await run_suite(client, args)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        log.close()
+
+
+# ---- Reporting and baselines ----
+
+def format_table(results: list, flagged: dict = None) -> str:
+    flagged = flagged or {}
+    rows = [('scenario', 'requests', 'errors', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s')]
+    rows += [result.row() + ((flagged[result.name],) if result.name in flagged else ()) for result in results]
+    widths = [max(len(row[i]) for row in rows if i < len(row)) for i in range(len(rows[0]))]
+    return '\n'.join('  '.join(cell.ljust(width) for cell, width in zip(row, widths + [0])).rstrip() for row in rows)
+
+
+def mode_of(args) -> str:
+    return 'in-process' if not args.server else f'{args.server} x{args.workers}'
+
+
+def load_baselines(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text())
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path: Path, mode: str, results: list, args):
+    baselines = load_baselines(path)
+    baselines[mode] = {
+        'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': f"{platform.node()} / {platform.processor() or platform.machine()} / Python {platform.python_version()}",
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'results': {r.name: {'p50': r.p50, 'p95': r.p95, 'p99': r.p99, 'throughput': r.throughput} for r in results},
+    }
+    path.write_text(json.dumps(baselines, indent=2) + '\n')
+
+
+def failures(results: list) -> dict:
+    """Scenarios with failed requests; their figures describe only part of the run"""
+    return {result.name: f"FAILED: {result.errors} errors" for result in results if result.errors}
+
+
+def compare(results: list, baseline: dict, threshold: float) -> dict:
+    """Scenarios that failed requests, or whose p95 or throughput regressed by more than threshold"""
+    flagged = {}
+    for result in results:
+        before = baseline.get('results', {}).get(result.name)
+        reasons = [f"{result.errors} errors"] if result.errors else []
+        if before and before['p95'] and result.p95 > before['p95'] * (1 + threshold):
+            reasons.append(f"p95 +{(result.p95 / before['p95'] - 1) * 100:.0f}%")
+        if before and before['throughput'] and result.throughput < before['throughput'] * (1 - threshold):
+            reasons.append(f"req/s -{(1 - result.throughput / before['throughput']) * 100:.0f}%")
+        if reasons:
+            flagged[result.name] = 'REGRESSION: ' + ', '.join(reasons)
+    return flagged
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the NIHOM admin API')
+    parser.add_argument('--server', choices=['uvicorn', 'gunicorn'], help='run against a local server (default: in-process)')
+    parser.add_argument('--workers', type=int, default=1, help='server worker processes (default: 1)')
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per scenario (default: 200)')
+    parser.add_argument('--warmup', type=int, default=20, help='untimed requests first (default: 20)')
+    parser.add_argument('--concurrency', type=int, default=10, help='requests in flight (default: 10)')
+    parser.add_argument('--sizes', type=lambda v: [int(n) for n in v.split(',')], default=list(GALLERY_SIZES),
+                        help='gallery sizes to list, comma separated (default: 10,1000,10000)')
+    parser.add_argument('--only', help='run only scenarios whose name contains one of these comma separated words')
+    parser.add_argument('--baseline', type=Path, default=BASELINE_FILE, help=f'baseline file (default: {BASELINE_FILE.name})')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the baseline for this mode')
+    parser.add_argument('--compare', action='store_true', help='flag regressions against the stored baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed regression as a fraction (default: 0.2)')
+    args = parser.parse_args()
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory(prefix='nihom-benchmark-') as work_dir:
+        args.work_dir = Path(work_dir)
+        configure_environment(args.work_dir)
+        sys.path.insert(0, str(Path(__file__).resolve().parent))
+        prepare_database()
+        resize_gallery(min(args.sizes) if args.sizes else GALLERY_SIZES[0])
+        runner = run_against_server if args.server else run_in_process
+        results = asyncio.run(runner(args))
+
+    mode = mode_of(args)
+    flagged = failures(results)
+    if args.compare:
+        baseline = load_baselines(args.baseline).get(mode)
+        if baseline is None:
+            print(f"[WARNING] No baseline for {mode} in {args.baseline}")
+        else:
+            flagged = compare(results, baseline, args.threshold)
+    print(f"{mode}, {args.requests} requests per scenario, concurrency {args.concurrency}")
+    print(format_table(results, flagged))
+    failed = failures(results)
+    if args.save_baseline:
+        if failed:
+            print(f"[ERROR] Not saving a baseline: {len(failed)} scenarios had failed requests")
+        else:
+            save_baseline(args.baseline, mode, results, args)
+            print(f"[OK] Baseline for {mode} saved to {args.baseline}")
+    if failed:
+        print(f"[ERROR] {len(failed)} scenarios had failed requests")
+    if flagged.keys() - failed.keys():
+        print(f"[ERROR] {len(flagged.keys() - failed.keys())} scenarios regressed by more than {args.threshold:.0%}")
+    if flagged:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Offline optimization stage for the static site.
+
+Runs over a site directory in place (a CI checkout or PUBLISH_DIR, never
+the frontend/ sources you edit):
+
+1. CSS and JS are minified into content-hashed copies (fingerprint.py)
+2. pages are pointed at those copies, get their critical CSS inlined with
+   the full stylesheets loaded asynchronously, and are minified (minify.py)
+3. `.gz`/`.br` siblings are written for everything that changed (compression.py)
+
+and prints a size report per page. Steps 1 and 2 need nothing beyond the
+standard library, so `--no-compress` runs on a bare Python (the Pages
+workflow); step 3 imports compression.py, which needs the app's
+requirements.
+
+Usage:
+    python build.py DIR [--no-compress]
+"""
+import argparse
+from pathlib import Path
+
+from fingerprint import fingerprint_assets, rewrite_references
+from minify import minify_asset, optimize_page
+
+
+def build_page(html: str, directory: Path, assets: dict) -> tuple:
+    """The optimized version of one page and its size report"""
+    return optimize_page(rewrite_references(html, assets), directory)
+
+
+def build(directory: Path, compress: bool = True) -> dict:
+    """Optimize the site in directory. Returns {'assets': ..., 'pages': {name: sizes}}"""
+    directory = Path(directory)
+    assets = fingerprint_assets(directory, transform=minify_asset)
+    pages = {}
+    for page in sorted(directory.glob('*.html')):
+        source = page.read_text(encoding='utf-8')
+        output, pages[page.name] = build_page(source, directory, assets)
+        if output != source:
+            page.write_text(output, encoding='utf-8')
+    if compress:
+        # Only here: compression.py pulls in starlette and the app config
+        from compression import precompress
+        precompress(directory)
+    return {'assets': assets, 'pages': pages}
+
+
+def format_report(pages: dict) -> str:
+    rows = [('page', 'source', 'minified', 'gzip', 'critical css', 'deferred css')]
+    for name, sizes in pages.items():
+        rows.append((name, *(f"{sizes[key] / 1024:.1f} KB" for key in (
+            'html_bytes', 'minified_bytes', 'gzip_bytes', 'critical_css_bytes', 'deferred_css_bytes'))))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return '\n'.join('  '.join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Minify, fingerprint and pre-compress the static site in place')
+    parser.add_argument('dir', type=Path, help='site directory to rewrite, e.g. a copy of frontend/')
+    parser.add_argument('--no-compress', action='store_true', help='skip writing .gz/.br files')
+    args = parser.parse_args()
+
+    report = build(args.dir, compress=not args.no_compress)
+    for name, hashed in report['assets'].items():
+        print(f"[OK] {name} -> {hashed}")
+    print(format_report(report['pages']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+"""In-process cache of serialized public API responses"""
+import hashlib
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Iterable, NamedTuple, Optional
+
+import orjson
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+from compression import ENCODINGS, compress, negotiate
+from config import settings
+
+# Rewritten with a fresh token on every invalidation so the other gunicorn
+# workers drop their copies too. The token, not the mtime, is compared: two
+# invalidations within the filesystem's timestamp granularity would otherwise
+# look like one. Beside this module rather than in the working directory, so
+# workers started from any directory share it.
+REVISION_FILE = Path(os.getenv('CACHE_REVISION_FILE', Path(__file__).resolve().parent / '.content-revision'))
+
+
+def _encode(obj):
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode='json', by_alias=True)
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+
+def serialize(data) -> bytes:
+    """Encode a response payload (schemas, lists and dicts of them) to JSON bytes"""
+    return orjson.dumps(data, default=_encode)
+
+
+def latest_update(data) -> Optional[datetime]:
+    """Newest updated_at among the rows making up a payload"""
+    if isinstance(data, dict):
+        items = data.values()
+    elif isinstance(data, (list, tuple)):
+        items = data
+    else:
+        return getattr(data, 'updated_at', None)
+    stamps = [stamp for stamp in map(latest_update, items) if stamp is not None]
+    return max(stamps) if stamps else None
+
+
+class Payload(NamedTuple):
+    """Response data together with headers that belong to it, such as a Link to the next page"""
+    data: object
+    headers: dict
+
+
+class CachedBody(NamedTuple):
+    """A serialized body with its validators and compressed forms"""
+    body: bytes
+    etag: str
+    last_modified: Optional[datetime]
+    extra_headers: tuple = ()
+    # (encoding, bytes) pairs, compressed once when the body is built
+    encoded: tuple = ()
+    media_type: str = "application/json"
+
+    @classmethod
+    def from_bytes(cls, body: bytes, last_modified: Optional[datetime] = None, extra_headers: tuple = (),
+                   media_type: str = "application/json") -> 'CachedBody':
+        """Wrap an already encoded body, computing its ETag and compressed forms"""
+        etag = '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+        encoded = ()
+        if len(body) >= settings.COMPRESS_MIN_SIZE:
+            encoded = tuple((encoding, compress(body, encoding, best=True)) for encoding in ENCODINGS)
+        return cls(body, etag, last_modified, extra_headers, encoded, media_type)
+
+    @classmethod
+    def build(cls, data, not_before: Optional[datetime] = None) -> 'CachedBody':
+        extra_headers = ()
+        if isinstance(data, Payload):
+            data, extra_headers = data.data, tuple(data.headers.items())
+        body = serialize(data)
+        last_modified = latest_update(data)
+        if last_modified is not None:
+            # Stored naive in UTC; HTTP dates have whole-second precision
+            last_modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+        # Deleting a row leaves every remaining updated_at untouched, so never
+        # report a date older than the last invalidation
+        if not_before is not None and (last_modified is None or last_modified < not_before):
+            last_modified = not_before.replace(microsecond=0)
+        return cls.from_bytes(body, last_modified, extra_headers)
+
+    def headers(self, cache_control: str) -> dict:
+        headers = {**dict(self.extra_headers), "ETag": self.etag, "Cache-Control": cache_control}
+        if self.last_modified is not None:
+            headers["Last-Modified"] = format_datetime(self.last_modified, usegmt=True)
+        return headers
+
+    def not_modified(self, request: Request) -> bool:
+        """Evaluate If-None-Match / If-Modified-Since against this body"""
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return "*" in tags or any(tag.removeprefix("W/") == self.etag for tag in tags)
+
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since and self.last_modified is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            if since.tzinfo is None:
+                since = since.replace(tzinfo=timezone.utc)
+            return self.last_modified <= since
+        return False
+
+    def to_response(self, request: Request, cache_control: str) -> Response:
+        headers = self.headers(cache_control)
+        body = self.body
+        if self.encoded:
+            headers["Vary"] = "Accept-Encoding"
+            encodings = dict(self.encoded)
+            encoding = negotiate(request.headers.get("accept-encoding"), encodings)
+            if encoding:
+                body = encodings[encoding]
+                headers["Content-Encoding"] = encoding
+                headers["ETag"] = "W/" + self.etag
+        if self.not_modified(request):
+            headers.pop("Content-Encoding", None)
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type=self.media_type, headers=headers)
+
+
+class ResponseCache:
+    """Pre-serialized JSON bodies keyed by endpoint, invalidated per content section.
+
+    Every entry records the sections it was built from. Invalidating a section
+    drops the entries depending on it and advances the global content revision,
+    so a body built concurrently from pre-invalidation rows is never stored.
+    Paginated endpoints make the key space open-ended, so at most max_entries
+    bodies are kept and the oldest is dropped first.
+    """
+
+    def __init__(self, revision_file: Path = REVISION_FILE, max_entries: int = 1024):
+        self._lock = threading.Lock()
+        self.max_entries = max_entries
+        self._entries: dict = {}
+        self._revision_file = revision_file
+        self._seen_stat = None
+        self._seen_stamp = self._read_stamp()
+        self.revision = 0
+
+    def _read_stamp(self) -> Optional[str]:
+        """The '<token> <time_ns>' last written to the revision file.
+
+        Called on every cache hit, so the file is only read when a stat says
+        it was replaced: each write is a new file, hence a new inode.
+        """
+        try:
+            st = os.stat(self._revision_file)
+        except OSError:
+            return None
+        stat = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if stat == self._seen_stat:
+            return self._seen_stamp
+        try:
+            stamp = self._revision_file.read_text(encoding='ascii')
+        except (OSError, UnicodeDecodeError):
+            return None
+        self._seen_stat = stat
+        return stamp
+
+    def _write_stamp(self) -> str:
+        stamp = f"{uuid.uuid4().hex} {time.time_ns()}"
+        # Replaced in one step, so another worker never reads half a token
+        temp = self._revision_file.with_name(f"{self._revision_file.name}.{os.getpid()}.tmp")
+        temp.write_text(stamp, encoding='ascii')
+        os.replace(temp, self._revision_file)
+        return stamp
+
+    def _sync_with_other_workers(self):
+        stamp = self._read_stamp()
+        if stamp != self._seen_stamp:
+            with self._lock:
+                self._seen_stamp = stamp
+                self._entries.clear()
+                self.revision += 1
+
+    def get(self, key: str) -> Optional[CachedBody]:
+        self._sync_with_other_workers()
+        entry = self._entries.get(key)
+        return entry[1] if entry else None
+
+    def _begin_build(self) -> tuple:
+        not_before = None
+        try:
+            not_before = datetime.fromtimestamp(int(self._seen_stamp.split()[1]) / 1e9, timezone.utc)
+        except (AttributeError, IndexError, ValueError):
+            pass
+        return self.revision, not_before
+
+    def _store(self, key: str, sections: Iterable[str], revision: int, body: CachedBody):
+        with self._lock:
+            # Only store if nothing was invalidated while we were building
+            if self.revision == revision:
+                if key not in self._entries and len(self._entries) >= self.max_entries:
+                    del self._entries[next(iter(self._entries))]
+                self._entries[key] = (tuple(sections), body)
+
+    def get_or_build(self, key: str, sections: Iterable[str], build: Callable[[], object]) -> CachedBody:
+        """Return the cached body for key, building and storing it on a miss"""
+        body = self.get(key)
+        if body is not None:
+            return body
+
+        revision, not_before = self._begin_build()
+        body = CachedBody.build(build(), not_before)
+        self._store(key, sections, revision, body)
+        return body
+
+    async def get_or_build_async(self, key: str, sections: Iterable[str],
+                                 build: Callable[[], Awaitable[object]]) -> CachedBody:
+        """Like get_or_build, with build a coroutine function"""
+        body = self.get(key)
+        if body is not None:
+            return body
+
+        revision, not_before = self._begin_build()
+        body = CachedBody.build(await build(), not_before)
+        self._store(key, sections, revision, body)
+        return body
+
+    def invalidate(self, *sections: str):
+        """Drop every entry built from any of the given sections"""
+        with self._lock:
+            self._entries = {
+                key: entry for key, entry in self._entries.items()
+                if not set(entry[0]).intersection(sections)
+            }
+            self.revision += 1
+            try:
+                self._seen_stamp = self._write_stamp()
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.revision += 1
+
+
+response_cache = ResponseCache()
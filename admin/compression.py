@@ -0,0 +1,198 @@
+"""gzip/brotli compression for API responses and static files.
+
+Dynamic JSON responses are compressed by CompressionMiddleware; bodies from
+the response cache carry their compressed forms already (see cache.py), so
+a cache hit costs no compression at all. Static text assets are compressed
+once by the build step below, which writes `.br` and `.gz` siblings that
+the static file handler (static_files.py) serves as they are.
+
+Brotli is used when the `brotli` package is installed, gzip otherwise.
+
+Usage:
+    python compression.py [DIR ...]    # default: the published site directory
+"""
+import argparse
+import gzip
+import os
+import re
+from pathlib import Path
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import settings
+from fingerprint import is_fingerprinted
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Preferred first when the client accepts several equally
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+# Files worth compressing ahead of time; images and fonts are compressed already
+TEXT_SUFFIXES = {'.html', '.css', '.js', '.mjs', '.json', '.svg', '.txt', '.xml', '.map', '.ico'}
+# Uploads stored under their SHA-256 (and the resized copies made from them)
+CONTENT_ADDRESSED_RE = re.compile(r'[0-9a-f]{64}(-\d+w)?\.\w+$')
+
+# Dynamic responses compressed on the fly; static files only ever use their siblings
+COMPRESSIBLE_TYPES = ('application/json',)
+
+
+def compress(data: bytes, encoding: str, best: bool = False) -> bytes:
+    """Compress data; best trades CPU for size and is meant for work done once"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if best else 5)
+    return gzip.compress(data, compresslevel=9 if best else 6, mtime=0)
+
+
+def accepted(accept_encoding: Optional[str]) -> list:
+    """Encodings we support that the Accept-Encoding header allows, best first"""
+    weights = {}
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+    wildcard = weights.get('*', 0.0)
+    ranked = [(weights.get(name, wildcard), -i, name) for i, name in enumerate(ENCODINGS)]
+    return [name for q, _, name in sorted(ranked, reverse=True) if q > 0]
+
+
+def negotiate(accept_encoding: Optional[str], available) -> Optional[str]:
+    """The best encoding of those available the client accepts, or None for identity"""
+    for name in accepted(accept_encoding):
+        if name in available:
+            return name
+    return None
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """Compress JSON responses of a known size of at least settings.COMPRESS_MIN_SIZE.
+
+    Responses that already have a Content-Encoding (cached bodies, precompressed
+    files), have no Content-Length or are larger than max_size pass through
+    untouched. Eligible bodies are collected, even if they arrive in several
+    chunks, and compressed in one go.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = None, max_size: int = 8 * 1024 * 1024):
+        self.app = app
+        self.minimum_size = settings.COMPRESS_MIN_SIZE if minimum_size is None else minimum_size
+        self.max_size = max_size
+
+    def _eligible(self, headers: Headers) -> bool:
+        try:
+            length = int(headers.get('content-length', ''))
+        except ValueError:
+            return False
+        return ('content-encoding' not in headers
+                and is_compressible(headers.get('content-type'))
+                and self.minimum_size <= length <= self.max_size)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get('accept-encoding'), ENCODINGS)
+        start: Optional[Message] = None
+        buffer = None
+
+        async def send_compressed(message: Message):
+            nonlocal start, buffer
+            if message['type'] == 'http.response.start':
+                headers = MutableHeaders(raw=message['headers'])
+                if not self._eligible(headers):
+                    await send(message)
+                    return
+                headers.add_vary_header('Accept-Encoding')
+                if not encoding:
+                    await send(message)
+                    return
+                start, buffer = message, bytearray()
+                return
+            if buffer is None or message['type'] != 'http.response.body':
+                await send(message)
+                return
+            buffer += message.get('body', b'')
+            if message.get('more_body', False):
+                return
+            body = compress(bytes(buffer), encoding)
+            headers = MutableHeaders(raw=start['headers'])
+            headers['Content-Encoding'] = encoding
+            headers['Content-Length'] = str(len(body))
+            if 'etag' in headers and not headers['etag'].startswith('W/'):
+                # The compressed bytes differ, so the validator can only be weak
+                headers['ETag'] = 'W/' + headers['etag']
+            await send(start)
+            await send({'type': 'http.response.body', 'body': body, 'more_body': False})
+
+        await self.app(scope, receive, send_compressed)
+
+
+def cache_control_for(path: str) -> Optional[str]:
+    """Cache-Control for a static file: forever if its name is derived from its content"""
+    name = Path(path).name
+    if is_fingerprinted(name) or CONTENT_ADDRESSED_RE.match(name):
+        return settings.ASSET_CACHE_CONTROL
+    if name.endswith('.html') or not name:
+        return settings.PAGE_CACHE_CONTROL
+    return None
+
+
+def precompress(directory: Path, force: bool = False) -> dict:
+    """Write `.gz` (and `.br`) siblings of every text asset under directory.
+
+    Siblings newer than their source are left alone, and siblings whose
+    source is gone are removed. Returns counts of written and removed files.
+    """
+    written = removed = 0
+    for path in sorted(Path(directory).rglob('*')):
+        if not path.is_file():
+            continue
+        if path.suffix in ('.gz', '.br'):
+            source = path.with_suffix('')
+            if source.suffix.lower() in TEXT_SUFFIXES and not source.exists():
+                path.unlink()
+                removed += 1
+            continue
+        if path.suffix.lower() not in TEXT_SUFFIXES or path.stat().st_size < settings.COMPRESS_MIN_SIZE:
+            continue
+        data = None
+        for encoding in ENCODINGS:
+            sibling = path.with_name(path.name + SUFFIXES[encoding])
+            if not force and sibling.exists() and sibling.stat().st_mtime >= path.stat().st_mtime:
+                continue
+            if data is None:
+                data = path.read_bytes()
+            tmp = sibling.with_name(f'.{sibling.name}.tmp')
+            tmp.write_bytes(compress(data, encoding, best=True))
+            os.replace(tmp, sibling)
+            written += 1
+    return {'written': written, 'removed': removed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write pre-compressed copies of the static site assets')
+    parser.add_argument('dirs', nargs='*', type=Path, help=f'directories (default: {settings.PUBLISH_DIR})')
+    parser.add_argument('--force', action='store_true', help='recompress every file')
+    args = parser.parse_args()
+    for directory in args.dirs or [settings.PUBLISH_DIR]:
+        report = precompress(directory, force=args.force)
+        print(f"[OK] {directory}: {report['written']} written, {report['removed']} stale removed")
+
+
+if __name__ == '__main__':
+    main()
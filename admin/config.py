@@ -8,14 +8,26 @@ env_path = Path(__file__).parent / '.env'
 if env_path.exists():
     load_dotenv(env_path)
 
+BASE_DIR = Path(__file__).resolve().parent.parent
+
 class Settings:
     """Application settings"""
 
     # Database
     DATABASE_URL: str = os.getenv('DATABASE_URL', 'sqlite:///nihom.db')
+    DB_POOL_SIZE: int = int(os.getenv('DB_POOL_SIZE', '10'))
+    DB_MAX_OVERFLOW: int = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+    # Apply pending schema migrations at startup (else run `python migrations.py`)
+    AUTO_MIGRATE: bool = os.getenv('AUTO_MIGRATE', 'true').lower() == 'true'
+    # 'wal' applies the tuned per-connection pragmas below, 'default' leaves SQLite as-is
+    SQLITE_PROFILE: str = os.getenv('SQLITE_PROFILE', 'wal')
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+    SQLITE_MMAP_SIZE: int = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+    SQLITE_CACHE_SIZE_KB: int = int(os.getenv('SQLITE_CACHE_SIZE_KB', '16384'))
 
     # Security
     SECRET_KEY: str = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
+    SESSION_TTL_SECONDS: int = int(os.getenv('SESSION_TTL_SECONDS', '28800'))
     ALLOWED_ORIGINS: list = os.getenv('ALLOWED_ORIGINS', 'http://localhost,http://localhost:8000').split(',')
 
     # Admin credentials (used for initial setup only)
@@ -30,6 +42,60 @@ class Settings:
     # CORS
     ENABLE_CORS: bool = os.getenv('ENABLE_CORS', 'true').lower() == 'true'
 
+    # HTTP caching of public content endpoints
+    PUBLIC_CACHE_CONTROL: str = os.getenv('PUBLIC_CACHE_CONTROL', 'public, max-age=60, must-revalidate')
+    # Static files: content-hashed assets and uploads never change, pages do
+    ASSET_CACHE_CONTROL: str = os.getenv('ASSET_CACHE_CONTROL', 'public, max-age=31536000, immutable')
+    PAGE_CACHE_CONTROL: str = os.getenv('PAGE_CACHE_CONTROL', 'public, max-age=60, must-revalidate')
+    # Responses and static text files smaller than this are sent uncompressed
+    COMPRESS_MIN_SIZE: int = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+    # In-memory cache of small static files (per worker): total bytes and largest file kept
+    STATIC_CACHE_BYTES: int = int(os.getenv('STATIC_CACHE_BYTES', str(32 * 1024 * 1024)))
+    STATIC_CACHE_MAX_FILE: int = int(os.getenv('STATIC_CACHE_MAX_FILE', str(256 * 1024)))
+
+    # Pagination of the course and gallery listings
+    PAGE_SIZE: int = int(os.getenv('PAGE_SIZE', '50'))
+    MAX_PAGE_SIZE: int = int(os.getenv('MAX_PAGE_SIZE', '200'))
+
+    # Metrics (/metrics, Prometheus text format, only answered to local clients)
+    METRICS_ENABLED: bool = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    # Where workers share their snapshots; default: a temp directory per server run
+    METRICS_DIR: str = os.getenv('METRICS_DIR', '')
+    METRICS_FLUSH_SECONDS: float = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+
+    # Logging: JSON lines (or 'text'), written by a background thread
+    LOG_LEVEL: str = os.getenv('LOG_LEVEL', 'INFO').upper()
+    LOG_FORMAT: str = os.getenv('LOG_FORMAT', 'json').lower()
+    LOG_FILE: str = os.getenv('LOG_FILE', '')
+    # Access lines of these path prefixes are sampled at LOG_SAMPLE_RATE (0-1);
+    # errors and requests slower than LOG_SLOW_MS are always logged
+    LOG_SAMPLED_ROUTES: tuple = tuple(p.strip() for p in os.getenv('LOG_SAMPLED_ROUTES', '/api/public/,/static').split(',') if p.strip())
+    LOG_SAMPLE_RATE: float = float(os.getenv('LOG_SAMPLE_RATE', '0.1'))
+    LOG_SLOW_MS: float = float(os.getenv('LOG_SLOW_MS', '1000'))
+
+    # On-demand profiling of single requests by admins (X-Profile: 1)
+    PROFILING_ENABLED: bool = os.getenv('PROFILING_ENABLED', 'true').lower() == 'true'
+    PROFILE_DIR: Path = Path(os.getenv('PROFILE_DIR', 'profiles'))
+    PROFILE_INTERVAL_MS: float = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+    PROFILE_KEEP: int = int(os.getenv('PROFILE_KEEP', '20'))
+
+    # Website files
+    FRONTEND_DIR: Path = Path(os.getenv('FRONTEND_DIR', BASE_DIR / 'frontend'))
+    UPLOAD_DIR: Path = Path(os.getenv('UPLOAD_DIR', BASE_DIR / 'uploads'))
+    # Uploads
+    MAX_UPLOAD_BYTES: int = int(os.getenv('MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+    MAX_CONCURRENT_UPLOADS: int = int(os.getenv('MAX_CONCURRENT_UPLOADS', '4'))
+    # Bulk gallery import: files per request, and bytes on disk per request
+    # (what is received plus what zip archives expand to)
+    MAX_IMPORT_FILES: int = int(os.getenv('MAX_IMPORT_FILES', '500'))
+    MAX_IMPORT_BYTES: int = int(os.getenv('MAX_IMPORT_BYTES', str(100 * 1024 * 1024)))
+    # Widths of the resized copies made of every uploaded image
+    IMAGE_WIDTHS: list = [int(w) for w in os.getenv('IMAGE_WIDTHS', '320,640,1024,1600').split(',')]
+    IMAGE_WORKERS: int = int(os.getenv('IMAGE_WORKERS', '2'))
+    # Where publish.py writes the rendered pages (and /static/frontend serves
+    # them from); frontend/ only holds the source templates
+    PUBLISH_DIR: Path = Path(os.getenv('PUBLISH_DIR', BASE_DIR / 'public'))
+
     # Production mode
     PRODUCTION: bool = os.getenv('PRODUCTION', 'False').lower() == 'true'
 
@@ -0,0 +1,169 @@
+"""Loaders for the public website content sections.
+
+Loaders select plain columns and build the response schemas directly, so
+no ORM instances (and no identity map bookkeeping) are created on reads.
+
+List endpoints are paginated by keyset: rows are ordered by
+(display_order, id) and a page continues after the cursor of the last row
+of the previous one, so every page is an index range scan however deep it
+is: (is_active, display_order, id) for the public listings of active rows,
+(display_order, id) for the admin listings of all of them.
+"""
+import base64
+from typing import Iterable, NamedTuple, Optional
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+from models import HeroContent, AboutContent, MissionVision, Course, GalleryImage, ContactInfo, ImageVariant
+from schemas import (HeroContentOut, AboutContentOut, MissionVisionOut, CourseOut,
+                     GalleryImageOut, ContactInfoOut, ImageVariantOut)
+
+
+def _select(model):
+    return select(*model.__table__.columns)
+
+
+def _first(db: Session, model, schema):
+    row = db.execute(_select(model).limit(1)).mappings().first()
+    return schema.model_validate(dict(row)) if row else None
+
+
+def _with_variants(db: Session, rows, schema) -> list:
+    """Validate image rows, attaching their resized variants with one extra query"""
+    rows = [dict(row) for row in rows]
+    urls = {row['image_url'] for row in rows if row['image_url']}
+    variants = {}
+    if urls:
+        query = (select(ImageVariant.source_url, ImageVariant.url, ImageVariant.width,
+                        ImageVariant.height, ImageVariant.format)
+                 .where(ImageVariant.source_url.in_(urls))
+                 .order_by(ImageVariant.width))
+        for variant in db.execute(query).mappings():
+            variants.setdefault(variant['source_url'], []).append(ImageVariantOut.model_validate(dict(variant)))
+    return [schema.model_validate({**row, 'variants': variants.get(row['image_url'], [])}) for row in rows]
+
+
+class Page(NamedTuple):
+    items: list
+    next_cursor: Optional[str]
+
+
+def encode_cursor(row) -> str:
+    # display_order is NOT NULL (migration 5), so the pair always compares
+    return base64.urlsafe_b64encode(f"{row.display_order}.{row.id}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """(display_order, id) of a cursor; raises ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        order, row_id = raw.split('.')
+        return int(order), int(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def _ordered(model, active_only: bool):
+    # Served by the (is_active, display_order, id) or the (display_order, id) index
+    query = _select(model).order_by(model.display_order, model.id)
+    if active_only:
+        query = query.where(model.is_active == True)
+    return query
+
+
+def _page(db: Session, model, schema, active_only: bool, limit: int, after: Optional[str]) -> Page:
+    query = _ordered(model, active_only).limit(limit + 1)
+    if after:
+        query = query.where(tuple_(model.display_order, model.id) > tuple_(*decode_cursor(after)))
+    items = _with_variants(db, db.execute(query).mappings(), schema)
+    if len(items) > limit:
+        items = items[:limit]
+        return Page(items, encode_cursor(items[-1]))
+    return Page(items, None)
+
+
+def load_hero(db: Session):
+    return _first(db, HeroContent, HeroContentOut)
+
+def load_about(db: Session):
+    return _first(db, AboutContent, AboutContentOut)
+
+def load_mission_vision(db: Session):
+    return _first(db, MissionVision, MissionVisionOut)
+
+def load_courses(db: Session, active_only: bool = True):
+    return _with_variants(db, db.execute(_ordered(Course, active_only)).mappings(), CourseOut)
+
+def load_courses_page(db: Session, limit: int, after: Optional[str] = None, active_only: bool = True) -> Page:
+    return _page(db, Course, CourseOut, active_only, limit, after)
+
+def load_course(db: Session, course_id: int):
+    rows = _with_variants(db, db.execute(_select(Course).where(Course.id == course_id)).mappings(), CourseOut)
+    return rows[0] if rows else None
+
+def load_gallery(db: Session, active_only: bool = True):
+    return _with_variants(db, db.execute(_ordered(GalleryImage, active_only)).mappings(), GalleryImageOut)
+
+def load_gallery_page(db: Session, limit: int, after: Optional[str] = None, active_only: bool = True) -> Page:
+    return _page(db, GalleryImage, GalleryImageOut, active_only, limit, after)
+
+def load_gallery_image(db: Session, image_id: int):
+    rows = _with_variants(db, db.execute(_select(GalleryImage).where(GalleryImage.id == image_id)).mappings(), GalleryImageOut)
+    return rows[0] if rows else None
+
+def load_contact(db: Session):
+    return _first(db, ContactInfo, ContactInfoOut)
+
+
+# Section name -> loader, in the order they appear on the homepage
+SECTIONS = {
+    "hero": load_hero,
+    "about": load_about,
+    "mission-vision": load_mission_vision,
+    "courses": load_courses,
+    "gallery": load_gallery,
+    "contact": load_contact,
+}
+
+
+def parse_sections(value: Optional[str]) -> list:
+    """Turn a comma separated selector into known section names, in page order.
+
+    Raises ValueError naming any unknown section.
+    """
+    if not value:
+        return list(SECTIONS)
+    requested = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = requested - SECTIONS.keys()
+    if unknown:
+        raise ValueError(f"Unknown sections: {', '.join(sorted(unknown))}")
+    return [name for name in SECTIONS if name in requested]
+
+
+# Listing sections and their page loaders
+PAGED_SECTIONS = {
+    "courses": load_courses_page,
+    "gallery": load_gallery_page,
+}
+
+
+def load_site(db: Session, sections: Iterable[str] = SECTIONS) -> dict:
+    """Load several sections through one session (and so one transaction)"""
+    return {name: SECTIONS[name](db) for name in sections}
+
+
+def load_site_page(db: Session, sections: Iterable[str], limit: int) -> tuple:
+    """load_site with every listing cut to its first page of limit rows.
+
+    Returns (site, {section: cursor of its next page}) for the listings
+    that have more rows.
+    """
+    site, cursors = {}, {}
+    for name in sections:
+        if name in PAGED_SECTIONS:
+            page = PAGED_SECTIONS[name](db, limit)
+            site[name] = page.items
+            if page.next_cursor:
+                cursors[name] = page.next_cursor
+        else:
+            site[name] = SECTIONS[name](db)
+    return site, cursors
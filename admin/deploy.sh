@@ -30,6 +30,9 @@ echo "Starting production server..."
 echo "====================================="
 echo ""
 
+# Application logs (JSON lines); a daemon has no stderr to write them to
+export LOG_FILE="${LOG_FILE:-logs/app.log}"
+
 gunicorn app_prod:app \
     --workers 4 \
     --worker-class uvicorn.workers.UvicornWorker \
@@ -40,7 +43,7 @@ gunicorn app_prod:app \
     --daemon
 
 echo "Server started on http://0.0.0.0:8000"
-echo "Logs: logs/access.log and logs/error.log"
+echo "Logs: logs/app.log, logs/access.log and logs/error.log"
 echo ""
 echo "To stop the server:"
 echo "  pkill gunicorn"
@@ -0,0 +1,112 @@
+"""Content-hashed file names for the site's CSS and JavaScript.
+
+Every asset gets a copy named after its content (styles.css ->
+styles.3f9a1c0b2d.css) and the pages are rewritten to reference the copy.
+A changed file gets a new name, so browsers can cache these copies forever
+and a deploy can never leave a stale stylesheet behind; only the HTML has
+to be revalidated.
+
+References that are already fingerprinted are updated too, so the step can
+run again over its own output.
+
+Usage:
+    python fingerprint.py DIR
+"""
+import argparse
+import hashlib
+import os
+import re
+from pathlib import Path
+from typing import Callable
+
+
+ASSET_SUFFIXES = ('.css', '.js')
+HASH_LENGTH = 10
+HASHED_RE = re.compile(r'\.[0-9a-f]{%d}(?=\.\w+$)' % HASH_LENGTH)
+
+
+def is_fingerprinted(name: str) -> bool:
+    return HASHED_RE.search(name) is not None
+
+
+def hashed_name(path: Path, data: bytes) -> str:
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    return f"{path.stem}.{digest}{path.suffix}"
+
+
+def fingerprint_assets(directory: Path, transform: Callable[[str, bytes], bytes] = None) -> dict:
+    """Write the hashed copy of every asset under directory.
+
+    transform(suffix, data), e.g. a minifier, is applied to the copy; the
+    original file is left untouched. Returns {relative path: relative hashed
+    path} using '/' separators. Hashed copies of earlier versions are removed.
+    """
+    directory = Path(directory)
+    assets = {}
+    for path in sorted(directory.rglob('*')):
+        if not path.is_file() or path.suffix not in ASSET_SUFFIXES or is_fingerprinted(path.name):
+            continue
+        data = path.read_bytes()
+        if transform is not None:
+            data = transform(path.suffix, data)
+        target = path.with_name(hashed_name(path, data))
+        if not target.exists():
+            tmp = target.with_name(f'.{target.name}.tmp')
+            tmp.write_bytes(data)
+            os.replace(tmp, target)
+        for old in path.parent.glob(f'{path.stem}.*{path.suffix}'):
+            if old != target and is_fingerprinted(old.name) and old.stem.rsplit('.', 1)[0] == path.stem:
+                old.unlink()
+        assets[path.relative_to(directory).as_posix()] = target.relative_to(directory).as_posix()
+    return assets
+
+
+def rewrite_references(html: str, assets: dict) -> str:
+    """Point src/href references to assets at their hashed names"""
+    if not assets:
+        return html
+    stems = {}
+    for name, hashed in assets.items():
+        stem, suffix = os.path.splitext(name)
+        stems[(stem, suffix)] = hashed
+    pattern = re.compile(
+        r'(?P<prefix>(?:src|href)=["\'](?:\./|/)?)'
+        r'(?P<stem>' + '|'.join(re.escape(stem) for stem, _ in stems) + r')'
+        r'(?:\.[0-9a-f]{%d})?(?P<suffix>\.css|\.js)(?=["\'?#])' % HASH_LENGTH
+    )
+
+    def replace(match):
+        hashed = stems.get((match.group('stem'), match.group('suffix')))
+        if hashed is None:
+            return match.group(0)
+        return match.group('prefix') + hashed
+
+    return pattern.sub(replace, html)
+
+
+def fingerprint(directory: Path) -> dict:
+    """Fingerprint the assets under directory and rewrite its pages in place"""
+    directory = Path(directory)
+    assets = fingerprint_assets(directory)
+    rewritten = []
+    for page in sorted(directory.glob('*.html')):
+        source = page.read_text(encoding='utf-8')
+        output = rewrite_references(source, assets)
+        if output != source:
+            page.write_text(output, encoding='utf-8')
+            rewritten.append(page.name)
+    return {'assets': assets, 'rewritten': rewritten}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Give the site CSS/JS content-hashed file names')
+    parser.add_argument('dir', type=Path, help='site directory to rewrite, e.g. a copy of frontend/')
+    args = parser.parse_args()
+    report = fingerprint(args.dir)
+    for name, hashed in report['assets'].items():
+        print(f"[OK] {name} -> {hashed}")
+    print(f"[OK] {len(report['rewritten'])} pages rewritten")
+
+
+if __name__ == '__main__':
+    main()
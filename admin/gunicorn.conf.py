@@ -0,0 +1,35 @@
+"""Gunicorn settings, picked up from the working directory (admin/).
+
+    gunicorn app_prod:app
+
+The app is preloaded: the master imports it and runs start-up (migrations,
+seeding, loading the admin panel) once, then forks the workers, which start
+serving without repeating any of it. Set GUNICORN_PRELOAD=false to have
+every worker import and start the app itself, e.g. to reload code on HUP.
+Command-line options override the values here.
+"""
+import os
+
+# Loads .env, so the variables below can be set there as well
+from config import settings
+
+bind = os.getenv('BIND', f"0.0.0.0:{os.getenv('PORT', '8000')}")
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+worker_class = 'uvicorn.workers.UvicornWorker'
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+
+def on_starting(server):
+    # Snapshots in a fixed METRICS_DIR are from the last run; summing them
+    # into this one would inflate every counter
+    if settings.METRICS_DIR and os.path.isdir(settings.METRICS_DIR):
+        for name in os.listdir(settings.METRICS_DIR):
+            if name.endswith('.json'):
+                os.remove(os.path.join(settings.METRICS_DIR, name))
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        from app_prod import IMPORT_STARTED
+        from startup import initialize
+        initialize(IMPORT_STARTED)
@@ -0,0 +1,91 @@
+"""Resized JPEG/WebP derivatives of uploaded images"""
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image, ImageOps
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Pillow format name, file suffix and encoder options per output format
+FORMATS = {
+    'jpeg': ('JPEG', '.jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', '.webp', {'quality': 80, 'method': 4}),
+}
+
+DERIVED_DIR = 'derived'
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def make_derivatives(source: str, upload_dir: str) -> list:
+    """Write width-bucketed JPEG and WebP copies of source.
+
+    Runs in a worker process, so it takes and returns plain values. Widths
+    larger than the original are skipped. An image narrower than the largest
+    configured width also gets a copy at its own width, so it has at least
+    one derivative per format; a wider one is not copied at full size, since
+    the largest width already covers it and the stored original remains.
+    Returns one dict per file written with its URL and dimensions.
+    """
+    source = Path(source)
+    out_dir = Path(upload_dir) / DERIVED_DIR
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            # Flatten transparency onto white, JPEG has no alpha channel
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.convert('RGBA').getchannel('A'))
+            image = background
+        elif image.mode == 'L':
+            image = image.convert('RGB')
+
+        widths = {w for w in settings.IMAGE_WIDTHS if w < image.width}
+        if image.width <= max(settings.IMAGE_WIDTHS):
+            widths.add(image.width)
+        widths = sorted(widths)
+        variants = []
+        for width in widths:
+            height = round(image.height * width / image.width)
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            for fmt, (pil_format, suffix, options) in FORMATS.items():
+                name = f"{source.stem}-{width}w{suffix}"
+                resized.save(out_dir / name, pil_format, **options)
+                variants.append({
+                    'url': f"uploads/{DERIVED_DIR}/{name}",
+                    'width': width,
+                    'height': height,
+                    'format': fmt,
+                })
+    return variants
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.IMAGE_WORKERS)
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def generate_derivatives(source: Path) -> list:
+    """Build the derivatives of source in the process pool, off the event loop"""
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_pool(), make_derivatives, str(source), str(settings.UPLOAD_DIR))
+    except (OSError, Image.DecompressionBombError) as e:
+        # Not an image Pillow can read; keep the upload without derivatives
+        logger.warning(f"No derivatives for {source.name}: {e}")
+        return []
@@ -0,0 +1,186 @@
+"""Non-blocking, structured application logging.
+
+Loggers only put records on an in-memory queue; a QueueListener thread
+formats them as JSON lines (or plain text with LOG_FORMAT=text) and writes
+them to stderr and, if LOG_FILE is set, to that file. A request handler
+never waits for log I/O.
+
+RequestLogMiddleware gives every request an id (taken from an incoming
+X-Request-ID or generated, and returned in the response) and writes one
+access line per request with its route, status, latency and user. Every
+record logged while a request runs carries the same request id, route and
+user. Access lines of routes in LOG_SAMPLED_ROUTES are sampled at
+LOG_SAMPLE_RATE; errors and requests slower than LOG_SLOW_MS are always
+written.
+"""
+import atexit
+import logging
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+import orjson
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import settings
+from metrics import route_label
+
+access_logger = logging.getLogger('nihom.access')
+
+# Fields of the request being handled; threadpool endpoints share the dict
+_request_context: ContextVar[Optional[dict]] = ContextVar('request_context', default=None)
+CONTEXT_FIELDS = ('request_id', 'route', 'user')
+
+# Attributes every LogRecord has; anything else was passed in `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+def set_user(username: str):
+    """Attach the authenticated user to the request being handled"""
+    context = _request_context.get()
+    if context is not None:
+        context['user'] = username
+
+
+class ContextFilter(logging.Filter):
+    """Copy the request context onto the record; runs in the logging thread's caller"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _request_context.get()
+        if context:
+            # The router fills in the matched route as the request goes in
+            context['route'] = route_label(context['scope'])
+            for field in CONTEXT_FIELDS:
+                if field in context and not hasattr(record, field):
+                    setattr(record, field, context[field])
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Enqueue the record as it is; message and traceback are formatted by the listener"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode('utf-8')
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = [f"{field}={getattr(record, field)}" for field in CONTEXT_FIELDS if hasattr(record, field)]
+        return f"{text} [{' '.join(fields)}]" if fields else text
+
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging():
+    """Route the root logger through the queue; safe to call more than once"""
+    global _listener
+    if _listener is not None:
+        return
+    formatter = JsonFormatter() if settings.LOG_FORMAT == 'json' else TextFormatter()
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if settings.LOG_FILE:
+        handlers.append(logging.FileHandler(settings.LOG_FILE, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(settings.LOG_LEVEL)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    # Threads do not survive fork(): a gunicorn worker forked from a --preload
+    # master needs its own listener
+    os.register_at_fork(after_in_child=_restart_listener)
+
+
+def _restart_listener():
+    if _listener is not None:
+        _listener._thread = None
+        _listener.start()
+
+
+def stop_logging():
+    """Write out what is still queued"""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def sampled(route: str) -> bool:
+    return route.startswith(settings.LOG_SAMPLED_ROUTES) and random.random() >= settings.LOG_SAMPLE_RATE
+
+
+class RequestLogMiddleware:
+    """Request ids, the request context for log records, and one access line per request"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for name, value in scope['headers']:
+            if name == b'x-request-id':
+                request_id = value.decode('latin-1')[:64]
+                break
+        context = {'scope': scope, 'request_id': request_id or uuid.uuid4().hex}
+        token = _request_context.set(context)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_id(message: Message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                MutableHeaders(raw=message['headers'])['X-Request-ID'] = context['request_id']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            latency_ms = (time.perf_counter() - started) * 1000
+            if status >= 500 or latency_ms >= settings.LOG_SLOW_MS or not sampled(route_label(scope)):
+                access_logger.log(
+                    logging.ERROR if status >= 500 else logging.INFO,
+                    f"{scope['method']} {scope['path']} {status}",
+                    extra={'method': scope['method'], 'path': scope['path'], 'status': status,
+                           'latency_ms': round(latency_ms, 2)},
+                )
+            _request_context.reset(token)
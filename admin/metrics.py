@@ -0,0 +1,349 @@
+"""Request, database, password and upload metrics in the Prometheus text format.
+
+Every worker records into its own in-process Registry and writes a snapshot
+of it to settings.METRICS_DIR every few seconds from a background thread,
+when it exits, and when scraped. The
+/metrics endpoint sums the snapshots of all workers, so a scrape answered by
+any one gunicorn worker covers the whole server. Snapshots of workers that
+have exited are folded into one retired.json, which keeps the counters
+monotonic without the directory growing as gunicorn recycles workers.
+
+Recorded:
+- request count by method, route and status, and latency by method and route
+- SQL statements and their time, per route and overall
+- bcrypt password checks and receiving uploads, timed separately
+"""
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import event
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+# bcrypt takes a few hundred milliseconds by design; uploads are bounded by the network
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# name: (type, help, buckets)
+METRICS = {
+    'nihom_http_requests_total': ('counter', 'HTTP requests by method, route and status', None),
+    'nihom_http_request_duration_seconds': ('histogram', 'HTTP request latency by method and route', LATENCY_BUCKETS),
+    'nihom_db_queries_total': ('counter', 'SQL statements executed, by route', None),
+    'nihom_db_query_seconds_total': ('counter', 'Time spent in SQL statements, by route', None),
+    'nihom_db_query_duration_seconds': ('histogram', 'Latency of single SQL statements', QUERY_BUCKETS),
+    'nihom_password_verify_seconds': ('histogram', 'Time spent checking passwords with bcrypt', SLOW_BUCKETS),
+    'nihom_upload_receive_seconds': ('histogram', 'Time spent receiving and storing upload requests', SLOW_BUCKETS),
+    'nihom_upload_bytes_total': ('counter', 'Bytes of uploaded files received', None),
+}
+
+
+class Registry:
+    """Counters and histograms of one process, keyed by (name, labels)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: dict = {}
+        # (name, labels) -> [bucket counts..., sum, count]
+        self.histograms: dict = {}
+
+    def inc(self, name: str, labels: tuple = (), value: float = 1.0):
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, labels: tuple = ()):
+        buckets = METRICS[name][2]
+        key = (name, labels)
+        with self._lock:
+            series = self.histograms.get(key)
+            if series is None:
+                series = self.histograms[key] = [0] * (len(buckets) + 2)
+            # Counts per bucket here (larger values only in +Inf); made cumulative when rendered
+            index = bisect_left(buckets, value)
+            if index < len(buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def clear(self):
+        self._lock = threading.Lock()
+        self.counters.clear()
+        self.histograms.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), list(series)] for (name, labels), series in self.histograms.items()],
+            }
+
+    def merge(self, snapshot: dict):
+        with self._lock:
+            for name, labels, value in snapshot.get('counters', ()):
+                key = (name, tuple(map(tuple, labels)))
+                self.counters[key] = self.counters.get(key, 0.0) + value
+            for name, labels, series in snapshot.get('histograms', ()):
+                if name not in METRICS or len(series) != len(METRICS[name][2]) + 2:
+                    continue  # written by a version with other buckets
+                key = (name, tuple(map(tuple, labels)))
+                current = self.histograms.setdefault(key, [0] * len(series))
+                for i, value in enumerate(series):
+                    current[i] += value
+
+
+registry = Registry()
+# What a preloading master recorded before forking is not the workers' to report
+os.register_at_fork(after_in_child=registry.clear)
+
+
+# ---- Exposition ----
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+def render(reg: Registry) -> str:
+    """The registry in the Prometheus text exposition format (0.0.4)"""
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(reg.counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {value:g}')
+            continue
+        for (metric, labels), series in sorted(reg.histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, series):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", f"{bound:g}"),))} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {series[-1]}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {series[-2]:g}')
+            lines.append(f'{name}_count{_format_labels(labels)} {series[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+# ---- Sharing between workers ----
+
+def metrics_dir() -> Path:
+    # Namespaced by the parent (the gunicorn master), so a restarted server
+    # starts from zero instead of adding to the last run's snapshots
+    return Path(settings.METRICS_DIR or Path(tempfile.gettempdir()) / f'nihom-metrics-{os.getppid()}')
+
+
+_worker = None  # (pid, snapshot file name)
+_last_flush = 0.0
+
+
+def snapshot_name() -> str:
+    # Decided in the worker, not at import: with --preload every worker forks from the master
+    global _worker
+    pid = os.getpid()
+    if _worker is None or _worker[0] != pid:
+        _worker = (pid, f'{pid}-{time.time_ns()}.json')
+    return _worker[1]
+
+
+def flush():
+    """Write this worker's snapshot for the others to read"""
+    global _last_flush
+    directory = metrics_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    name = snapshot_name()
+    path = directory / name
+    tmp = directory / f'.{name}.tmp'
+    tmp.write_text(json.dumps(registry.snapshot()))
+    os.replace(tmp, path)
+    _last_flush = time.monotonic()
+
+
+_flusher_pid = None
+
+
+def start_flusher():
+    """Flush every METRICS_FLUSH_SECONDS and at exit, so an idle worker's counts still show"""
+    global _flusher_pid
+    pid = os.getpid()
+    if _flusher_pid == pid:
+        return
+    # Per process: a forked worker inherits neither the thread nor the master's role
+    _flusher_pid = pid
+    threading.Thread(target=_flush_periodically, name='metrics-flush', daemon=True).start()
+    atexit.register(_flush_at_exit, pid)
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(settings.METRICS_FLUSH_SECONDS)
+        if time.monotonic() - _last_flush < settings.METRICS_FLUSH_SECONDS / 2:
+            continue  # a scrape just did it
+        try:
+            flush()
+        except OSError as e:
+            logger.warning(f"Could not write metrics snapshot: {e}")
+
+
+def _flush_at_exit(pid: int):
+    if os.getpid() == pid:
+        flush()
+
+
+RETIRED = 'retired.json'
+
+
+def _alive(pid: int) -> bool:
+    # Signal 0 only checks; on Windows, though, os.kill terminates the
+    # process. gunicorn does not run there, so nothing gets retired.
+    if pid == os.getpid() or os.name == 'nt':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _retire_exited(directory: Path):
+    """Fold the snapshots of exited workers into RETIRED; call with the directory locked"""
+    exited = []
+    for path in directory.glob('*.json'):
+        pid = path.name.split('-')[0]
+        if path.name != RETIRED and pid.isdigit() and not _alive(int(pid)):
+            exited.append(path)
+    if not exited:
+        return
+    retired = Registry()
+    for path in (directory / RETIRED, *exited):
+        try:
+            retired.merge(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            continue
+    tmp = directory / f'.{RETIRED}.tmp'
+    tmp.write_text(json.dumps(retired.snapshot()))
+    os.replace(tmp, directory / RETIRED)
+    for path in exited:
+        path.unlink(missing_ok=True)
+
+
+def collect() -> Registry:
+    """The sum of the snapshots of every worker, this one up to date"""
+    from migrations import migration_lock
+    flush()
+    directory = metrics_dir()
+    total = Registry()
+    # Scrapes in other workers must not see a snapshot both retired and still in place
+    with migration_lock(directory / '.lock'):
+        _retire_exited(directory)
+        for path in directory.glob('*.json'):
+            try:
+                total.merge(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue  # being replaced; its next version counts next time
+    return total
+
+
+# ---- Recording ----
+
+class RequestStats:
+    __slots__ = ('queries', 'query_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+
+
+# Statistics of the request being handled; threadpool endpoints share the object
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar('request_stats', default=None)
+
+
+@contextmanager
+def timed(name: str, labels: tuple = ()):
+    """Observe the duration of the block in the histogram name"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(name, time.perf_counter() - started, labels)
+
+
+def instrument_engine(engine):
+    """Count the statements a (sync) engine executes and time them"""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        registry.observe('nihom_db_query_duration_seconds', elapsed)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.query_seconds += elapsed
+
+
+def route_label(scope: Scope) -> str:
+    """The route template (not the concrete path) the request matched"""
+    route = scope.get('route')
+    if route is not None:
+        return route.path
+    if 'endpoint' in scope:  # a mount such as /static
+        return scope.get('root_path') or '/'
+    return 'unmatched'
+
+
+class MetricsMiddleware:
+    """Record latency, status and SQL statements of every HTTP request"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        start_flusher()
+        started = time.perf_counter()
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_stats.reset(token)
+            method, route = scope['method'], route_label(scope)
+            registry.inc('nihom_http_requests_total', (('method', method), ('route', route), ('status', str(status))))
+            registry.observe('nihom_http_request_duration_seconds', time.perf_counter() - started,
+                             (('method', method), ('route', route)))
+            if stats.queries:
+                registry.inc('nihom_db_queries_total', (('route', route),), stats.queries)
+                registry.inc('nihom_db_query_seconds_total', (('route', route),), stats.query_seconds)
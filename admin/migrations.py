@@ -0,0 +1,236 @@
+"""Versioned schema migrations.
+
+create_all only creates missing tables, so every later change to models.py
+(a column, an index, a table) is shipped as a numbered migration below.
+Applied versions are recorded in the schema_version table; migrate() applies
+the pending ones in order while holding a file lock, so gunicorn workers
+starting together run each migration once.
+
+Migrations must be idempotent: a database created before this runner
+existed starts at version 0 and replays all of them.
+
+Usage:
+    python migrations.py [status|upgrade]
+"""
+import argparse
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, MetaData, String, Table, func, inspect, insert, select, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.schema import CreateIndex
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import models
+
+logger = logging.getLogger(__name__)
+
+_meta = MetaData()
+schema_version = Table(
+    'schema_version', _meta,
+    Column('version', Integer, primary_key=True),
+    Column('name', String(100)),
+    Column('applied_at', DateTime, default=datetime.utcnow),
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    upgrade: Callable
+    # Transactional migrations get a connection inside one transaction;
+    # the others get the engine and manage their own (e.g. online index builds)
+    transactional: bool = True
+
+
+# ---- Helpers for writing migrations ----
+
+def add_column(conn, table_name: str, column: Column):
+    """ALTER TABLE ADD COLUMN unless the column already exists"""
+    existing = {col['name'] for col in inspect(conn).get_columns(table_name)}
+    if column.name not in existing:
+        col_type = column.type.compile(dialect=conn.dialect)
+        conn.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {column.name} {col_type}'))
+
+
+def create_tables(conn, *tables):
+    models.Base.metadata.create_all(bind=conn, tables=list(tables))
+
+
+def create_index_online(engine: Engine, index):
+    """Build an index without blocking the application for the whole migration.
+
+    PostgreSQL builds it CONCURRENTLY (outside any transaction). SQLite has no
+    such option, but each index is built in its own short transaction so WAL
+    readers carry on and writers only wait for that one statement.
+    """
+    ddl = CreateIndex(index, if_not_exists=True)
+    if engine.dialect.name == 'postgresql':
+        statement = str(ddl.compile(dialect=engine.dialect)).replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY', 1)
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text(statement))
+    else:
+        with engine.begin() as conn:
+            conn.execute(ddl)
+
+
+# ---- Migrations ----
+
+def _initial_schema(conn):
+    create_tables(conn, *(model.__table__ for model in (
+        models.HeroContent, models.AboutContent, models.MissionVision,
+        models.Course, models.GalleryImage, models.ContactInfo, models.AdminUser,
+    )))
+
+def _content_updated_at(conn):
+    for model in (models.HeroContent, models.AboutContent, models.MissionVision,
+                  models.Course, models.GalleryImage, models.ContactInfo):
+        add_column(conn, model.__tablename__, Column('updated_at', DateTime))
+
+def _image_tables(conn):
+    create_tables(conn, models.ImageVariant.__table__, models.UploadedFile.__table__)
+
+def _listing_indexes(engine):
+    # Spelled out, not read from the models, so the indexes built do not
+    # depend on the version of the code that runs the migration
+    meta = MetaData()
+    for name in ('courses', 'gallery_images'):
+        table = Table(name, meta, Column('id', Integer), Column('is_active', Boolean),
+                      Column('display_order', Integer))
+        for index in (Index(f'ix_{name}_active_order', table.c.is_active, table.c.display_order, table.c.id),
+                      Index(f'ix_{name}_order', table.c.display_order, table.c.id)):
+            create_index_online(engine, index)
+
+def _display_order_not_null(conn):
+    for model in (models.Course, models.GalleryImage):
+        table = model.__tablename__
+        conn.execute(text(f'UPDATE {table} SET display_order = 0 WHERE display_order IS NULL'))
+        # SQLite cannot add the constraint to an existing column; the ORM
+        # default keeps NULL out of new rows there
+        if conn.dialect.name == 'postgresql':
+            conn.execute(text(f'ALTER TABLE {table} ALTER COLUMN display_order SET DEFAULT 0'))
+            conn.execute(text(f'ALTER TABLE {table} ALTER COLUMN display_order SET NOT NULL'))
+
+
+MIGRATIONS = [
+    Migration(1, 'initial schema', _initial_schema),
+    Migration(2, 'updated_at on content tables', _content_updated_at),
+    Migration(3, 'image variant and upload tables', _image_tables),
+    Migration(4, 'listing indexes', _listing_indexes, transactional=False),
+    Migration(5, 'display_order not null', _display_order_not_null),
+]
+
+HEAD = MIGRATIONS[-1].version
+
+
+# ---- Runner ----
+
+def lock_path(engine: Engine) -> Path:
+    """Lock file beside a SQLite database file, else in the working directory"""
+    url = make_url(str(engine.url))
+    if url.get_backend_name() == 'sqlite' and url.database and url.database != ':memory:':
+        return Path(f"{url.database}.migrate.lock")
+    return Path('.migrate.lock')
+
+
+@contextmanager
+def migration_lock(path: Path):
+    """Exclusive lock across processes for as long as the block runs"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a+') as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def current_version(engine: Engine) -> int:
+    """Highest applied version; 0 for a database the runner has not touched.
+
+    One query on a warm database: asking for the table first would cost a
+    catalog lookup on every start.
+    """
+    try:
+        with engine.connect() as conn:
+            return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+    except (OperationalError, ProgrammingError):
+        # No schema_version table yet
+        return 0
+
+
+def pending(engine: Engine) -> list:
+    version = current_version(engine)
+    return [m for m in MIGRATIONS if m.version > version]
+
+
+def migrate(engine: Engine = None) -> list:
+    """Apply every pending migration in order. Returns the versions applied."""
+    engine = engine or models.engine
+    # Cheap check first so an up-to-date database never waits for the lock
+    if not pending(engine):
+        return []
+
+    applied = []
+    with migration_lock(lock_path(engine)):
+        _meta.create_all(bind=engine)
+        # Another process may have migrated while we waited for the lock
+        for migration in pending(engine):
+            started = time.perf_counter()
+            if migration.transactional:
+                with engine.begin() as conn:
+                    migration.upgrade(conn)
+                    conn.execute(insert(schema_version).values(version=migration.version, name=migration.name))
+            else:
+                migration.upgrade(engine)
+                with engine.begin() as conn:
+                    conn.execute(insert(schema_version).values(version=migration.version, name=migration.name))
+            logger.info(f"Applied migration {migration.version} ({migration.name}) "
+                        f"in {time.perf_counter() - started:.2f}s")
+            applied.append(migration.version)
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply NIHOM database migrations')
+    parser.add_argument('command', nargs='?', choices=['status', 'upgrade'], default='upgrade')
+    args = parser.parse_args()
+
+    version = current_version(models.engine)
+    if args.command == 'status':
+        print(f"Database at version {version}, latest is {HEAD}")
+        for migration in pending(models.engine):
+            print(f"  pending: {migration.version} {migration.name}")
+        return
+
+    applied = migrate(models.engine)
+    for v in applied:
+        print(f"[OK] Applied migration {v}")
+    print(f"[OK] Database at version {current_version(models.engine)}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,374 @@
+"""Dependency-free minifiers and critical-CSS extraction for the static site.
+
+The minifiers are deliberately conservative: they drop comments and
+collapse whitespace outside strings, template literals and regular
+expressions, and never rename or reorder anything, so the output behaves
+exactly like the input.
+
+optimize_page inlines the CSS rules that style the top of a page (the
+navigation bar and the first section) and loads the full stylesheets
+without blocking rendering.
+"""
+import gzip
+import re
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Optional
+
+# ---- CSS ----
+
+_CSS_TOKEN_RE = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|(/\*.*?\*/)|(\s+)''', re.S)
+_CSS_TIGHT_RE = re.compile(r'\s*([{};,>~])\s*|(:)\s+')
+
+
+def minify_css(css: str) -> str:
+    def squeeze(chunk: str) -> str:
+        return _CSS_TIGHT_RE.sub(lambda m: m.group(1) or m.group(2), chunk)
+
+    # Keep strings verbatim and squeeze everything between them
+    parts, chunk, pos = [], [], 0
+    for match in _CSS_TOKEN_RE.finditer(css):
+        chunk.append(css[pos:match.start()])
+        string = match.group(1)
+        if string:
+            parts.append(squeeze(''.join(chunk)))
+            parts.append(string)
+            chunk = []
+        else:
+            chunk.append(' ')
+        pos = match.end()
+    chunk.append(css[pos:])
+    parts.append(squeeze(''.join(chunk)))
+    return ''.join(parts).replace(';}', '}').strip()
+
+
+# ---- JavaScript ----
+
+# After these a '/' starts a regular expression rather than a division
+_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+_REGEX_KEYWORDS = {'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void', 'throw', 'case', 'do', 'else', 'yield', 'await'}
+
+
+def _skip_string(js: str, i: int) -> int:
+    """Index just past the string or template literal starting at i"""
+    quote = js[i]
+    i += 1
+    while i < len(js):
+        ch = js[i]
+        if ch == '\\':
+            i += 2
+            continue
+        if ch == quote:
+            return i + 1
+        if quote == '`' and js.startswith('${', i):
+            i = _skip_braces(js, i + 2)
+            continue
+        i += 1
+    return i
+
+
+def _skip_braces(js: str, i: int) -> int:
+    """Index just past the '}' closing a template substitution that starts at i"""
+    depth = 1
+    while i < len(js) and depth:
+        ch = js[i]
+        if ch in '\'"`':
+            i = _skip_string(js, i)
+            continue
+        if ch == '{':
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+        i += 1
+    return i
+
+
+def _skip_regex(js: str, i: int) -> int:
+    in_class = False
+    i += 1
+    while i < len(js) and js[i] != '\n':
+        ch = js[i]
+        if ch == '\\':
+            i += 2
+            continue
+        if ch == '[':
+            in_class = True
+        elif ch == ']':
+            in_class = False
+        elif ch == '/' and not in_class:
+            i += 1
+            while i < len(js) and js[i].isalpha():
+                i += 1
+            return i
+        i += 1
+    return i
+
+
+def _is_word(ch: str) -> bool:
+    return ch.isalnum() or ch in '_$'
+
+
+def minify_js(js: str) -> str:
+    """Drop comments and indentation; newlines are kept so semicolon insertion is unaffected"""
+    out = []
+    i, n = 0, len(js)
+    pending_space = None  # whitespace seen since the last token: ' ' or '\n'
+    last = ''             # last token written, for the regex/division decision
+
+    def emit(text: str):
+        nonlocal pending_space, last
+        if out and pending_space == '\n':
+            out.append('\n')
+        elif out and pending_space == ' ' and (
+                (_is_word(last[-1]) and _is_word(text[0])) or (last[-1] in '+-' and text[0] == last[-1])):
+            out.append(' ')
+        pending_space = None
+        out.append(text)
+        last = text
+
+    while i < n:
+        ch = js[i]
+        if ch.isspace():
+            j = i
+            while j < n and js[j].isspace():
+                j += 1
+            pending_space = '\n' if '\n' in js[i:j] or pending_space == '\n' else ' '
+            i = j
+        elif js.startswith('//', i):
+            j = js.find('\n', i)
+            i = n if j < 0 else j
+        elif js.startswith('/*', i):
+            j = js.find('*/', i + 2)
+            i = n if j < 0 else j + 2
+            pending_space = pending_space or ' '
+        elif ch in '\'"`':
+            j = _skip_string(js, i)
+            emit(js[i:j])
+            i = j
+        elif ch == '/' and (not last or last[-1] in _REGEX_PRECEDERS or last in _REGEX_KEYWORDS):
+            j = _skip_regex(js, i)
+            emit(js[i:j])
+            i = j
+        elif _is_word(ch):
+            j = i
+            while j < n and _is_word(js[j]):
+                j += 1
+            emit(js[i:j])
+            i = j
+        else:
+            emit(ch)
+            i += 1
+    return ''.join(out)
+
+
+# ---- HTML ----
+
+_RAW_BLOCK_RE = re.compile(r'(<(pre|textarea|script|style)\b[^>]*>)(.*?)(</\2\s*>)', re.S | re.I)
+_COMMENT_RE = re.compile(r'<!--(?!\[if).*?-->', re.S)
+_SPACE_RE = re.compile(r'\s+')
+_SCRIPT_TYPE_RE = re.compile(r'\btype\s*=\s*["\']?([^"\'\s>]+)', re.I)
+
+
+def _collapse(text: str) -> str:
+    return _SPACE_RE.sub(lambda m: '\n' if '\n' in m.group(0) else ' ', text)
+
+
+def minify_html(html: str) -> str:
+    """Remove comments and collapse whitespace; inline CSS/JS is minified too.
+
+    Runs of whitespace become a single space (or newline), which renders the
+    same; <pre> and <textarea> are left alone.
+    """
+    parts, pos = [], 0
+    for match in _RAW_BLOCK_RE.finditer(html):
+        parts.append(_collapse(_COMMENT_RE.sub('', html[pos:match.start()])))
+        open_tag, tag, body, close_tag = match.groups()
+        tag = tag.lower()
+        if tag == 'style':
+            body = minify_css(body)
+        elif tag == 'script':
+            script_type = _SCRIPT_TYPE_RE.search(open_tag)
+            if not script_type or script_type.group(1).lower() in ('text/javascript', 'module'):
+                body = minify_js(body)
+        parts.append(open_tag + body + close_tag)
+        pos = match.end()
+    parts.append(_collapse(_COMMENT_RE.sub('', html[pos:])))
+    return ''.join(parts).strip() + '\n'
+
+
+# ---- Critical CSS ----
+
+class _AboveTheFold(HTMLParser):
+    """Collects the tags, classes and ids from <body> to the end of the first <section>"""
+
+    def __init__(self):
+        super().__init__()
+        self.tags, self.classes, self.ids = {'html', 'body'}, set(), set()
+        self.in_body = self.done = False
+        self.section_depth = 0
+        self.seen_section = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'body':
+            self.in_body = True
+        if not self.in_body or self.done:
+            return
+        if tag == 'section':
+            self.section_depth += 1
+            self.seen_section = True
+        self.tags.add(tag)
+        for name, value in attrs:
+            if name == 'class' and value:
+                self.classes.update(value.split())
+            elif name == 'id' and value:
+                self.ids.add(value)
+
+    def handle_endtag(self, tag):
+        if tag == 'section' and self.in_body and not self.done:
+            self.section_depth -= 1
+            if self.seen_section and self.section_depth == 0:
+                self.done = True
+
+
+_SELECTOR_PARTS_RE = re.compile(r'([.#]?)(-?[_a-zA-Z][\w-]*)')
+_PSEUDO_RE = re.compile(r'::?[\w-]+(\([^)]*\))?|\[[^\]]*\]')
+
+
+def _selector_matches(selector: str, page: _AboveTheFold) -> bool:
+    selector = _PSEUDO_RE.sub('', selector)
+    for prefix, name in _SELECTOR_PARTS_RE.findall(selector):
+        if prefix == '.' and name not in page.classes:
+            return False
+        if prefix == '#' and name not in page.ids:
+            return False
+        if not prefix and name.lower() not in page.tags:
+            return False
+    return True
+
+
+def _parse_blocks(css: str) -> list:
+    """Split minified CSS into (prelude, body) pairs; statements get body None"""
+    blocks, i, n = [], 0, len(css)
+    while i < n:
+        j = i
+        while j < n and css[j] not in '{;':
+            if css[j] in '"\'':
+                j = _skip_string(css, j)
+                continue
+            j += 1
+        prelude = css[i:j].strip()
+        if j >= n or css[j] == ';':
+            if prelude:
+                blocks.append((prelude, None))
+            i = j + 1
+            continue
+        depth, k = 1, j + 1
+        while k < n and depth:
+            if css[k] in '"\'':
+                k = _skip_string(css, k)
+                continue
+            depth += {'{': 1, '}': -1}.get(css[k], 0)
+            k += 1
+        blocks.append((prelude, css[j + 1:k - 1]))
+        i = k
+    return blocks
+
+
+def _critical_blocks(blocks: list, page: _AboveTheFold) -> list:
+    keep = []
+    for prelude, body in blocks:
+        if body is None or prelude.startswith('@font-face') or prelude == ':root':
+            keep.append((prelude, body))
+        elif prelude.startswith(('@media', '@supports')):
+            inner = _critical_blocks(_parse_blocks(body), page)
+            if inner:
+                keep.append((prelude, _join_blocks(inner)))
+        elif prelude.startswith('@'):
+            continue  # @keyframes are added below if a kept rule uses them
+        elif any(_selector_matches(selector, page) for selector in prelude.split(',')):
+            keep.append((prelude, body))
+    return keep
+
+
+def _join_blocks(blocks: list) -> str:
+    return ''.join(f'{prelude};' if body is None else f'{prelude}{{{body}}}' for prelude, body in blocks)
+
+
+def critical_css(css: str, html: str) -> str:
+    """The rules of css that can apply to the top of html, as minified CSS"""
+    page = _AboveTheFold()
+    page.feed(html)
+    blocks = _parse_blocks(minify_css(css))
+    critical = _join_blocks(_critical_blocks(blocks, page))
+    # Animations used by the kept rules
+    keyframes = [(prelude, body) for prelude, body in blocks
+                 if body is not None and prelude.startswith(('@keyframes', '@-webkit-keyframes'))
+                 and re.search(r'[:\s,]%s\b' % re.escape(prelude.split()[-1]), critical)]
+    return critical + _join_blocks(keyframes)
+
+
+# ---- Pages ----
+
+_STYLESHEET_RE = re.compile(r'<link\b(?=[^>]*\brel=["\']?stylesheet)[^>]*>', re.I)
+_HREF_RE = re.compile(r'\bhref=["\']([^"\']+)["\']', re.I)
+CRITICAL_MARKER = 'data-critical'
+
+
+def _local_file(directory: Path, href: str) -> Optional[Path]:
+    if re.match(r'^[a-z]+:|^//', href):
+        return None
+    path = (directory / href.split('?')[0].split('#')[0].lstrip('/')).resolve()
+    return path if path.is_file() and directory.resolve() in path.parents else None
+
+
+def optimize_page(html: str, directory: Path) -> tuple:
+    """Inline critical CSS, load stylesheets asynchronously and minify html.
+
+    Stylesheets are looked up in directory. Returns (html, size report).
+    Pages that were already optimized are only minified.
+    """
+    directory = Path(directory)
+    report = {'html_bytes': len(html.encode('utf-8'))}
+    critical, deferred = '', 0
+
+    if CRITICAL_MARKER not in html:
+        links = _STYLESHEET_RE.findall(html)
+        for link in links:
+            href = _HREF_RE.search(link)
+            path = _local_file(directory, href.group(1)) if href else None
+            if path is not None:
+                css = path.read_text(encoding='utf-8')
+                deferred += len(css.encode('utf-8'))
+                critical += critical_css(css, html)
+
+        def defer(match):
+            link = match.group(0)
+            preload = re.sub(r'\brel=["\']?stylesheet["\']?', 'rel="preload" as="style"', link, flags=re.I)
+            preload = preload[:-1].rstrip('/ ') + ' onload="this.onload=null;this.rel=\'stylesheet\'">'
+            return f'{preload}<noscript>{link}</noscript>'
+
+        if links:
+            html = _STYLESHEET_RE.sub(defer, html)
+            style = f'<style {CRITICAL_MARKER}>{critical}</style>'
+            # Before the first stylesheet so the cascade order is unchanged
+            first = html.find('<link rel="preload"')
+            html = html[:first] + style + html[first:]
+
+    html = minify_html(html)
+    encoded = html.encode('utf-8')
+    report.update({
+        'minified_bytes': len(encoded),
+        'gzip_bytes': len(gzip.compress(encoded, 9)),
+        'critical_css_bytes': len(critical.encode('utf-8')),
+        'deferred_css_bytes': deferred,
+    })
+    return html, report
+
+
+def minify_asset(suffix: str, data: bytes) -> bytes:
+    """Minify the content of a .css or .js file; other files are returned as-is"""
+    if suffix == '.css':
+        return minify_css(data.decode('utf-8')).encode('utf-8')
+    if suffix == '.js':
+        return minify_js(data.decode('utf-8')).encode('utf-8')
+    return data
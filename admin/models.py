@@ -1,7 +1,11 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, Boolean, DateTime
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event, select, Column, Index, Integer, String, Text, Boolean, DateTime
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
+from sqlalchemy.orm import declarative_base, sessionmaker
 from datetime import datetime
+import os
+from config import settings
 
 Base = declarative_base()
 
@@ -18,6 +22,7 @@ class HeroContent(Base):
     stat_students = Column(Integer, default=500)
     stat_programs = Column(Integer, default=3)
     stat_faculty = Column(Integer, default=50)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class AboutContent(Base):
     __tablename__ = 'about_content'
@@ -28,12 +33,14 @@ class AboutContent(Base):
     paragraph1 = Column(Text)
     paragraph2 = Column(Text)
     paragraph3 = Column(Text)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class MissionVision(Base):
     __tablename__ = 'mission_vision'
     id = Column(Integer, primary_key=True)
     mission_text = Column(Text)
     vision_text = Column(Text)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Course(Base):
     __tablename__ = 'courses'
@@ -43,7 +50,13 @@ class Course(Base):
     short_description = Column(Text)
     image_url = Column(String(500))
     is_active = Column(Boolean, default=True)
-    display_order = Column(Integer, default=0)
+    # NOT NULL: listings page by (display_order, id), and NULL does not compare
+    display_order = Column(Integer, default=0, server_default='0', nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Public listings (active rows only) and admin listings (all rows)
+    __table_args__ = (Index('ix_courses_active_order', 'is_active', 'display_order', 'id'),
+                      Index('ix_courses_order', 'display_order', 'id'))
 
 class GalleryImage(Base):
     __tablename__ = 'gallery_images'
@@ -51,8 +64,33 @@ class GalleryImage(Base):
     image_url = Column(String(500))
     alt_text = Column(String(200))
     caption = Column(String(500))
-    display_order = Column(Integer, default=0)
+    display_order = Column(Integer, default=0, server_default='0', nullable=False)
     is_active = Column(Boolean, default=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (Index('ix_gallery_images_active_order', 'is_active', 'display_order', 'id'),
+                      Index('ix_gallery_images_order', 'display_order', 'id'))
+
+class ImageVariant(Base):
+    """A resized copy of an uploaded image, matched to rows by their image_url"""
+    __tablename__ = 'image_variants'
+    id = Column(Integer, primary_key=True)
+    source_url = Column(String(500), index=True)
+    url = Column(String(500))
+    width = Column(Integer)
+    height = Column(Integer)
+    format = Column(String(10))
+
+class UploadedFile(Base):
+    """A stored upload, addressed by the SHA-256 of its content"""
+    __tablename__ = 'uploaded_files'
+    id = Column(Integer, primary_key=True)
+    sha256 = Column(String(64), unique=True)
+    url = Column(String(500))
+    original_name = Column(String(255))
+    content_type = Column(String(100))
+    size = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 class ContactInfo(Base):
     __tablename__ = 'contact_info'
@@ -60,6 +98,7 @@ class ContactInfo(Base):
     location = Column(Text)
     email = Column(String(100))
     phone = Column(String(50))
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class AdminUser(Base):
     __tablename__ = 'admin_users'
@@ -69,88 +108,246 @@ class AdminUser(Base):
     email = Column(String(100))
 
 # Database setup
-engine = create_engine('sqlite:///nihom.db', echo=False)
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    """Per-connection SQLite settings for the tuned profile.
+
+    WAL lets readers proceed while a writer holds the lock, so public reads
+    never queue behind an admin save; synchronous=NORMAL is durable in WAL
+    mode and avoids an fsync per commit.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+def in_memory_sqlite(url: str) -> bool:
+    database = make_url(url).database
+    return not database or database == ':memory:' or 'mode=memory' in url
+
+def sqlite_pool_args(url: str) -> dict:
+    """Pool settings for a SQLite url.
+
+    An in-memory database lives only as long as its connection, so every
+    session has to share one (StaticPool, which takes no sizing arguments).
+    """
+    if in_memory_sqlite(url):
+        return {'poolclass': StaticPool}
+    return {'pool_size': settings.DB_POOL_SIZE, 'max_overflow': settings.DB_MAX_OVERFLOW}
+
+def create_db_engine(url: str = None):
+    """Create the engine for url (default settings.DATABASE_URL)"""
+    url = url or settings.DATABASE_URL
+    if not url.startswith('sqlite'):
+        return create_engine(
+            url,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_pre_ping=True,
+            echo=False,
+        )
+
+    engine = create_engine(
+        url,
+        connect_args={
+            'check_same_thread': False,
+            'timeout': settings.SQLITE_BUSY_TIMEOUT_MS / 1000,
+        },
+        echo=False,
+        **sqlite_pool_args(url),
+    )
+    if settings.SQLITE_PROFILE == 'wal':
+        apply_sqlite_profile(engine)
+    return engine
+
+def apply_sqlite_profile(engine):
+    """Install the tuned profile on a (sync) SQLite engine.
+
+    Transactions start with a deferred BEGIN, so reads take no lock. One
+    that later writes has to upgrade its read lock, though, and SQLite fails
+    that upgrade at once with "database is locked" instead of waiting out
+    busy_timeout. Write transactions therefore run on a connection with the
+    execution option sqlite_begin='BEGIN IMMEDIATE' (see WriteSessionLocal),
+    which waits for the write lock when the transaction starts.
+    """
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        # Let SQLAlchemy, not the sqlite3 module, decide when transactions start
+        dbapi_connection.isolation_level = None
+        _sqlite_pragmas(dbapi_connection, connection_record)
+
+    @event.listens_for(engine, 'begin')
+    def on_begin(conn):
+        # sqlite3 skips BEGIN before SELECTs; emitting it gives every session
+        # one consistent read snapshot
+        conn.exec_driver_sql(conn.get_execution_options().get('sqlite_begin', 'BEGIN'))
+
+# Async drivers for the URL schemes we support
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'mysql': 'mysql+aiomysql',
+}
+
+def async_database_url(url: str) -> str:
+    """Swap the driver in url for its asyncio counterpart"""
+    scheme, sep, rest = url.partition('://')
+    dialect = scheme.split('+')[0]
+    return ASYNC_DRIVERS.get(dialect, scheme) + sep + rest
+
+def create_async_db_engine(url: str = None):
+    """Async twin of create_db_engine, used by the public read endpoints"""
+    url = async_database_url(url or settings.DATABASE_URL)
+    if not url.startswith('sqlite'):
+        return create_async_engine(
+            url,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_pre_ping=True,
+        )
+
+    # aiosqlite defaults to NullPool, which opens a connection (and its thread) per session
+    pool_args = {'poolclass': AsyncAdaptedQueuePool, **sqlite_pool_args(url)}
+    engine = create_async_engine(
+        url,
+        connect_args={'timeout': settings.SQLITE_BUSY_TIMEOUT_MS / 1000},
+        **pool_args,
+    )
+    if settings.SQLITE_PROFILE == 'wal':
+        # Read-only: public reads run in snapshots next to the writer
+        apply_sqlite_profile(engine.sync_engine)
+    return engine
+
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# For sessions that write: on SQLite they take the write lock when they begin
+WriteSessionLocal = sessionmaker(autocommit=False, autoflush=False,
+                                 bind=engine.execution_options(sqlite_begin='BEGIN IMMEDIATE'))
+
+async_engine = create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+def _dispose_after_fork():
+    # A worker forked from a preloading gunicorn master opens its own
+    # connections instead of sharing the master's
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+
+os.register_at_fork(after_in_child=_dispose_after_fork)
+
+def check_schema():
+    """Apply pending migrations, or refuse to start on an old schema with AUTO_MIGRATE off"""
+    from migrations import migrate, pending
+    if settings.AUTO_MIGRATE:
+        migrate(engine)
+    elif pending(engine):
+        raise RuntimeError("Database schema is out of date; run `python migrations.py upgrade`")
+
+def needs_seed() -> bool:
+    with engine.connect() as conn:
+        return conn.execute(select(AdminUser.id).limit(1)).first() is None
+
+def seed_once() -> bool:
+    """Seed an empty database. Returns whether this process did it.
+
+    Workers starting together on an empty database would all find it empty,
+    so the seed runs under the migration lock and the check is repeated
+    once the lock is held.
+    """
+    if not needs_seed():
+        return False
+    from migrations import lock_path, migration_lock
+    with migration_lock(lock_path(engine)):
+        if not needs_seed():
+            return False
+        seed_db()
+    print("[OK] Database initialized with seed data")
+    print("[OK] Admin user: admin / admin123")
+    return True
 
 def init_db():
-    """Initialize database with tables and seed data"""
-    Base.metadata.create_all(bind=engine)
+    """Bring the schema up to date and seed an empty database"""
+    check_schema()
+    seed_once()
 
-    db = SessionLocal()
+def seed_db(db=None):
+    """Insert the default admin and the site's initial content (into db, else a new session)"""
+    owned = db is None
+    db = db or WriteSessionLocal()
     try:
-        # Check if data exists
-        if db.query(AdminUser).count() == 0:
-            # Create default admin (password: admin123)
-            admin = AdminUser(
-                username='admin',
-                password='$2b$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LewY5GyYIm.KUiy/O',  # bcrypt hash of 'admin123'
-                email='admin@nihom.edu.bd'
-            )
-            db.add(admin)
-
-            # Seed hero content
-            hero = HeroContent(
-                description='Developing skilled human resources in culinary and hospitality management, adhering to global standards'
-            )
-            db.add(hero)
-
-            # Seed about content
-            about = AboutContent(
-                section_title='Navy Institute of Hospitality Management',
-                lead_text='Navy Institute of Hospitality Management (NIHOM) is a renowned organization run under the supervision of Bangladesh Navy. It is located at Labonchora, Khulna.',
-                paragraph1='As an independent institution with its own Board of Governors, NIHOM is dedicated to provide exceptional education and training in the field of hospitality management. It is situated at the campus of School of Logistics and Management (SOLAM) of Bangladesh Navy.',
-                paragraph2='At Navy Institute of Hospitality Management, we offer a range of comprehensive programs specializing in areas such as Bakery and Pastry Production, Food and Beverage Production and Food and Beverage Service. Our institute boasts state-of-the-art equipment and furniture, providing our students with a hands-on learning experience in a modern and conducive environment.',
-                paragraph3='We take pride in our team of highly skilled teachers, trainers, chefs, and demonstrators who work tirelessly to ensure our students to receive the highest quality education. Their expertise and commitment play a crucial role in shaping the future professionals of the culinary and hospitality industry.'
-            )
-            db.add(about)
-
-            # Seed mission and vision
-            mv = MissionVision(
-                mission_text='The mission of Navy Institute of Hospitality Management (NIHOM) is to preserve and elevate the culinary arts in the form of practical and theoretical training. Through our various courses like food and beverage production, bakery and pastry production, food and beverage service we aim to inspire the students, make them skilled and confident in the culinary and service profession.',
-                vision_text='Our vision of Navy Institute of Hospitality Management (NIHOM) extends beyond educating and training students to achieve professional excellence in the Hospitality Industry. We aspire to shape the individuals as qualified for future through unlocking true potential of them and nurturing their individual growth.'
-            )
-            db.add(mv)
-
-            # Seed courses
-            courses = [
-                Course(slug='bakery-pastry', title='Bakery and Pastry Production',
-                       short_description='Master the art of baking and pastry making with hands-on training in modern techniques and traditional methods.',
-                       image_url='Nihom Web_extracted/images/bakery-pastry-production.jpg', display_order=1),
-                Course(slug='food-beverage-production', title='Food and Beverage Production',
-                       short_description='Learn professional cooking techniques, menu planning, and kitchen management from expert chefs.',
-                       image_url='Nihom Web_extracted/images/food-beverage-production.jpg', display_order=2),
-                Course(slug='food-beverage-service', title='Food and Beverage Service',
-                       short_description='Develop excellence in service management, customer relations, and hospitality operations.',
-                       image_url='Nihom Web_extracted/images/food-beverage-service.jpg', display_order=3)
-            ]
-            for course in courses:
-                db.add(course)
-
-            # Seed gallery
-            gallery = [
-                GalleryImage(image_url='Various Photos_extracted/images/gallery-1.jpg', alt_text='Bakery and Pastry Production - NIHOM', display_order=1),
-                GalleryImage(image_url='Various Photos_extracted/images/gallery-2.jpg', alt_text='Bakery and Pastry Training - NIHOM', display_order=2),
-                GalleryImage(image_url='Various Photos_extracted/images/gallery-3.jpg', alt_text='Pastry Arts - NIHOM', display_order=3),
-                GalleryImage(image_url='Various Photos_extracted/images/gallery-4.jpg', alt_text='Food and Beverage Production - NIHOM', display_order=4),
-                GalleryImage(image_url='Various Photos_extracted/images/gallery-5.jpg', alt_text='Culinary Training - NIHOM', display_order=5),
-                GalleryImage(image_url='Various Photos_extracted/images/gallery-6.jpg', alt_text='Food and Beverage Service - NIHOM', display_order=6)
-            ]
-            for img in gallery:
-                db.add(img)
-
-            # Seed contact info
-            contact = ContactInfo(
-                location='Labonchora, Khulna\nCampus of School of Logistics and Management (SOLAM)\nBangladesh Navy',
-                email='info@nihom.edu.bd',
-                phone='Contact number coming soon'
-            )
-            db.add(contact)
-
-            db.commit()
-            print("[OK] Database initialized with seed data")
-            print("[OK] Admin user: admin / admin123")
+        # Create default admin (password: admin123)
+        admin = AdminUser(
+            username='admin',
+            password='$2b$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LewY5GyYIm.KUiy/O',  # bcrypt hash of 'admin123'
+            email='admin@nihom.edu.bd'
+        )
+        db.add(admin)
+
+        # Seed hero content
+        hero = HeroContent(
+            description='Developing skilled human resources in culinary and hospitality management, adhering to global standards'
+        )
+        db.add(hero)
+
+        # Seed about content
+        about = AboutContent(
+            section_title='Navy Institute of Hospitality Management',
+            lead_text='Navy Institute of Hospitality Management (NIHOM) is a renowned organization run under the supervision of Bangladesh Navy. It is located at Labonchora, Khulna.',
+            paragraph1='As an independent institution with its own Board of Governors, NIHOM is dedicated to provide exceptional education and training in the field of hospitality management. It is situated at the campus of School of Logistics and Management (SOLAM) of Bangladesh Navy.',
+            paragraph2='At Navy Institute of Hospitality Management, we offer a range of comprehensive programs specializing in areas such as Bakery and Pastry Production, Food and Beverage Production and Food and Beverage Service. Our institute boasts state-of-the-art equipment and furniture, providing our students with a hands-on learning experience in a modern and conducive environment.',
+            paragraph3='We take pride in our team of highly skilled teachers, trainers, chefs, and demonstrators who work tirelessly to ensure our students to receive the highest quality education. Their expertise and commitment play a crucial role in shaping the future professionals of the culinary and hospitality industry.'
+        )
+        db.add(about)
+
+        # Seed mission and vision
+        mv = MissionVision(
+            mission_text='The mission of Navy Institute of Hospitality Management (NIHOM) is to preserve and elevate the culinary arts in the form of practical and theoretical training. Through our various courses like food and beverage production, bakery and pastry production, food and beverage service we aim to inspire the students, make them skilled and confident in the culinary and service profession.',
+            vision_text='Our vision of Navy Institute of Hospitality Management (NIHOM) extends beyond educating and training students to achieve professional excellence in the Hospitality Industry. We aspire to shape the individuals as qualified for future through unlocking true potential of them and nurturing their individual growth.'
+        )
+        db.add(mv)
+
+        # Seed courses
+        courses = [
+            Course(slug='bakery-pastry', title='Bakery and Pastry Production',
+                   short_description='Master the art of baking and pastry making with hands-on training in modern techniques and traditional methods.',
+                   image_url='Nihom Web_extracted/images/bakery-pastry-production.jpg', display_order=1),
+            Course(slug='food-beverage-production', title='Food and Beverage Production',
+                   short_description='Learn professional cooking techniques, menu planning, and kitchen management from expert chefs.',
+                   image_url='Nihom Web_extracted/images/food-beverage-production.jpg', display_order=2),
+            Course(slug='food-beverage-service', title='Food and Beverage Service',
+                   short_description='Develop excellence in service management, customer relations, and hospitality operations.',
+                   image_url='Nihom Web_extracted/images/food-beverage-service.jpg', display_order=3)
+        ]
+        for course in courses:
+            db.add(course)
+
+        # Seed gallery
+        gallery = [
+            GalleryImage(image_url='Various Photos_extracted/images/gallery-1.jpg', alt_text='Bakery and Pastry Production - NIHOM', display_order=1),
+            GalleryImage(image_url='Various Photos_extracted/images/gallery-2.jpg', alt_text='Bakery and Pastry Training - NIHOM', display_order=2),
+            GalleryImage(image_url='Various Photos_extracted/images/gallery-3.jpg', alt_text='Pastry Arts - NIHOM', display_order=3),
+            GalleryImage(image_url='Various Photos_extracted/images/gallery-4.jpg', alt_text='Food and Beverage Production - NIHOM', display_order=4),
+            GalleryImage(image_url='Various Photos_extracted/images/gallery-5.jpg', alt_text='Culinary Training - NIHOM', display_order=5),
+            GalleryImage(image_url='Various Photos_extracted/images/gallery-6.jpg', alt_text='Food and Beverage Service - NIHOM', display_order=6)
+        ]
+        for img in gallery:
+            db.add(img)
+
+        # Seed contact info
+        contact = ContactInfo(
+            location='Labonchora, Khulna\nCampus of School of Logistics and Management (SOLAM)\nBangladesh Navy',
+            email='info@nihom.edu.bd',
+            phone='Contact number coming soon'
+        )
+        db.add(contact)
+
+        db.commit()
     finally:
-        db.close()
+        if owned:
+            db.close()
 
 def get_db():
     db = SessionLocal()
@@ -158,3 +355,15 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def get_write_db():
+    db = WriteSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db():
+    """Async session dependency; queries run on the event loop, not in the threadpool"""
+    async with AsyncSessionLocal() as db:
+        yield db
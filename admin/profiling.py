@@ -0,0 +1,284 @@
+"""Profiling of single requests, on demand.
+
+An admin marks a request with the `X-Profile: 1` header or a `profile=1`
+query parameter and authenticates it with a session token (Bearer header or
+session cookie). While that request runs:
+
+- a background thread samples the Python call stacks every
+  settings.PROFILE_INTERVAL_MS (folded stacks, ready for flamegraph tools);
+- every SQL statement is recorded with its parameters and duration, and the
+  query plan of each SELECT is captured afterwards (EXPLAIN QUERY PLAN on
+  SQLite, EXPLAIN elsewhere).
+
+The report is stored under settings.PROFILE_DIR and its id returned in the
+X-Profile-Id response header; GET /api/profiles/{id} downloads it.
+
+Requests without the flag only pay for looking at the header and query
+string. The SQL hooks are installed when the first profiled request arrives.
+Samples cover every busy thread of the process, so requests running at the
+same time show up as well.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from auth import session_token, session_user
+from config import settings
+import models
+
+PROFILE_HEADER = b'x-profile'
+PROFILE_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+# Stdlib modules a thread sits in while it has nothing to do
+IDLE_MODULES = ('threading.py', 'selectors.py', 'queue.py', os.path.join('concurrent', 'futures', 'thread.py'))
+MAX_PARAMETER_LENGTH = 200
+
+
+class StackSampler:
+    """Counts the call stacks of the busy threads at a fixed interval"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me or frame.f_code.co_filename.endswith(IDLE_MODULES):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                thread = names.get(ident, f'thread-{ident}')
+                self.stacks[';'.join([thread, *reversed(stack)])] += 1
+
+
+class Profile:
+    def __init__(self, profile_id: str, user: str, scope: Scope):
+        self.id = profile_id
+        self.user = user
+        self.method = scope['method']
+        self.path = scope['path']
+        self.query_string = scope.get('query_string', b'').decode('latin-1')
+        self.started = time.perf_counter()
+        self.queries = []
+        # Set once the request is done; the report's own EXPLAINs are not recorded
+        self.closed = False
+        self.sampler = StackSampler(settings.PROFILE_INTERVAL_MS / 1000)
+
+    def record_query(self, engine_name: str, statement: str, parameters, duration: float):
+        if self.closed:
+            return
+        self.queries.append({
+            'engine': engine_name,
+            'statement': statement,
+            'parameters': parameters,
+            'duration_ms': round(duration * 1000, 3),
+        })
+
+
+# The profile of the request being handled, if it is being profiled
+_current: ContextVar[Optional[Profile]] = ContextVar('profile', default=None)
+_hooks_installed = False
+_hooks_lock = threading.Lock()
+
+
+def install_hooks():
+    """Record statements of profiled requests on both engines (once per process)"""
+    global _hooks_installed
+    with _hooks_lock:
+        if _hooks_installed:
+            return
+        for name, engine in (('sync', models.engine), ('async', models.async_engine.sync_engine)):
+            _instrument(name, engine)
+        _hooks_installed = True
+
+
+def _instrument(name: str, engine):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        profile = _current.get()
+        if profile is not None and conn.info.get('profile_started'):
+            elapsed = time.perf_counter() - conn.info['profile_started'].pop()
+            profile.record_query(name, statement, parameters, elapsed)
+
+
+def explain(statement: str, parameters) -> Optional[list]:
+    """The query plan of a SELECT, as rows of strings; None for other statements"""
+    if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+    engine = models.engine
+    prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    try:
+        with engine.connect() as conn:
+            rows = conn.exec_driver_sql(prefix + statement, parameters or ()).fetchall()
+    except Exception as e:
+        return [f"EXPLAIN failed: {e}"]
+    return [' | '.join(str(value) for value in row) for row in rows]
+
+
+def _printable(parameters):
+    if isinstance(parameters, (list, tuple)):
+        return [_printable(value) for value in parameters]
+    if isinstance(parameters, dict):
+        return {key: _printable(value) for key, value in parameters.items()}
+    text = repr(parameters)
+    return text if len(text) <= MAX_PARAMETER_LENGTH else text[:MAX_PARAMETER_LENGTH] + '...'
+
+
+def build_report(profile: Profile, status: int, duration: float) -> dict:
+    """The downloadable report; runs the EXPLAINs, so call it off the event loop"""
+    queries = []
+    for query in profile.queries:
+        queries.append({
+            **query,
+            'parameters': _printable(query['parameters']),
+            'plan': explain(query['statement'], query['parameters']),
+        })
+    return {
+        'id': profile.id,
+        'user': profile.user,
+        'request': {'method': profile.method, 'path': profile.path, 'query': profile.query_string},
+        'status': status,
+        'duration_ms': round(duration * 1000, 3),
+        'sql': {
+            'count': len(queries),
+            'total_ms': round(sum(q['duration_ms'] for q in queries), 3),
+            'statements': queries,
+        },
+        'stacks': {
+            'interval_ms': settings.PROFILE_INTERVAL_MS,
+            'samples': profile.sampler.samples,
+            # "thread;outermost;...;innermost": samples, the folded format of flamegraph.pl/speedscope
+            'folded': dict(profile.sampler.stacks.most_common()),
+        },
+    }
+
+
+def profile_path(profile_id: str) -> Optional[Path]:
+    """Where a stored report lives; None for ids that are not ours"""
+    if not PROFILE_ID_RE.match(profile_id):
+        return None
+    return Path(settings.PROFILE_DIR) / f"{profile_id}.json"
+
+
+def save_report(report: dict):
+    directory = Path(settings.PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = profile_path(report['id'])
+    tmp = directory / f".{report['id']}.tmp"
+    tmp.write_text(json.dumps(report, indent=1, default=str))
+    os.replace(tmp, path)
+    # Keep only the newest reports
+    reports = sorted(directory.glob('*.json'), key=lambda p: p.stat().st_mtime, reverse=True)
+    for old in reports[settings.PROFILE_KEEP:]:
+        old.unlink(missing_ok=True)
+
+
+def requested(scope: Scope) -> bool:
+    """Whether the request asks to be profiled; the only cost for every other request"""
+    for name, value in scope['headers']:
+        if name == PROFILE_HEADER:
+            return value not in (b'', b'0')
+    query = scope.get('query_string', b'')
+    return b'profile=' in query and parse_qs(query.decode('latin-1')).get('profile', ['0'])[0] not in ('', '0')
+
+
+def profiling_user(scope: Scope) -> Optional[str]:
+    """Name of the admin whose session token the request carries"""
+    token = session_token(Request(scope))
+    if not token:
+        return None
+    db = models.SessionLocal()
+    try:
+        user = session_user(db, token)
+        return user.username if user else None
+    finally:
+        db.close()
+
+
+class ProfilingMiddleware:
+    """Profile requests flagged by an authenticated admin; see the module docstring"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http' or not requested(scope):
+            await self.app(scope, receive, send)
+            return
+        user = await run_in_threadpool(profiling_user, scope)
+        if user is None:
+            # Not an admin: the flag is ignored rather than revealing the feature
+            await self.app(scope, receive, send)
+            return
+
+        install_hooks()
+        profile = Profile(uuid.uuid4().hex, user, scope)
+        token = _current.set(profile)
+        profile.sampler.start()
+        status = 500
+        finished = False
+
+        async def finish():
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            profile.closed = True
+            profile.sampler.stop()
+            duration = time.perf_counter() - profile.started
+            report = await run_in_threadpool(build_report, profile, status, duration)
+            await run_in_threadpool(save_report, report)
+
+        async def send_profiled(message: Message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                headers = MutableHeaders(raw=message['headers'])
+                headers['X-Profile-Id'] = profile.id
+                headers.add_vary_header('X-Profile')
+            elif message['type'] == 'http.response.body' and not message.get('more_body', False):
+                # Stored before the response completes, so the client can fetch it right away
+                await finish()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            _current.reset(token)
+            await finish()
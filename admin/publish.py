@@ -0,0 +1,467 @@
+"""Render the static website pages from the database.
+
+The pages in frontend/ double as templates: every piece of database-driven
+content sits between `<!-- cms:NAME -->` and `<!-- /cms:NAME -->` markers and
+is re-rendered in place, so the output can be rendered again at any time.
+A manifest of content digests keeps publishing incremental: a page is only
+rewritten when the rows it is built from, its template or the file itself changed.
+
+Text columns are escaped and stored as plain text. Emphasis belongs to the
+template: a phrase the about paragraphs region wraps in <strong>, <em>, <b>
+or <i> is wrapped the same way wherever the rendered text contains it.
+
+Pages are written to PUBLISH_DIR (public/ by default); the templates in
+frontend/ are only read. publish_once() renders an empty PUBLISH_DIR at
+start-up, so the server has a site to serve before the first publish.
+
+`--check-seed` renders the templates from a fresh, seeded database and
+fails if that changes any of them: the shipped pages and the seed data
+have to agree, or the first publish would alter the live site. The regions
+in SEED_DRIFT, which already disagreed when the check was introduced, are
+left out.
+
+Usage:
+    python publish.py [--force] [--out DIR]
+    python publish.py --check-seed
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+from html import escape
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from cache import serialize
+from compression import precompress
+from build import build_page
+from fingerprint import fingerprint_assets
+from minify import minify_asset
+from config import settings
+from content import SECTIONS, load_courses, load_site
+from models import SessionLocal
+
+# Bump when the fragment markup below changes so every page is rebuilt
+RENDER_VERSION = 4
+MANIFEST_NAME = '.publish-manifest.json'
+
+REGION_RE = re.compile(r'<!-- cms:(?P<name>[\w.-]+) -->(?P<body>.*?)<!-- /cms:(?P=name) -->', re.S)
+
+# Image locations used by the seed data -> where they live under frontend/
+LEGACY_PREFIXES = {
+    'Nihom Web_extracted/': 'nihom-images/',
+    'Various Photos_extracted/': 'gallery-images/',
+}
+
+GALLERY_ICON = [
+    '<span class="gallery-icon" aria-hidden="true">',
+    '    <svg viewBox="0 0 24 24" focusable="false">',
+    '        <path d="M2 12s4-6 10-6 10 6 10 6-4 6-10 6S2 12 2 12z" fill="none" stroke="currentColor" stroke-width="1.8" stroke-linecap="round" stroke-linejoin="round"></path>',
+    '        <circle cx="12" cy="12" r="2.5" fill="none" stroke="currentColor" stroke-width="1.6"></circle>',
+    '    </svg>',
+    '</span>',
+]
+
+
+def text(value) -> str:
+    return escape('' if value is None else str(value))
+
+
+EMPHASIS_RE = re.compile(r'<(strong|em|b|i)>([^<]+)</\1>')
+
+
+def emphasise(html: str, phrases: list) -> str:
+    """Wrap each (tag, phrase) of the template's emphasis around the phrase in html"""
+    tags = {phrase: tag for tag, phrase in phrases}
+    if not tags:
+        return html
+    # Longest first, so a phrase inside a longer one does not split it
+    pattern = re.compile('|'.join(map(re.escape, sorted(tags, key=len, reverse=True))))
+    return pattern.sub(lambda m: f'<{tags[m.group()]}>{m.group()}</{tags[m.group()]}>', html)
+
+
+def multiline(value) -> str:
+    return '<br>'.join(text(line) for line in ('' if value is None else str(value)).splitlines())
+
+
+def public_url(url: Optional[str], uploads: set) -> str:
+    """Map a stored image URL to one that resolves from the published pages"""
+    url = url or ''
+    if url.startswith(('http://', 'https://', '//', '/', 'data:')):
+        return url
+    for old, new in LEGACY_PREFIXES.items():
+        if url.startswith(old):
+            return new + url[len(old):]
+    if url.startswith('uploads/'):
+        uploads.add(url[len('uploads/'):])
+    return url
+
+
+def image_tag(row, attrs: str, sizes: str, uploads: set) -> list:
+    """An <img> for row.image_url, wrapped in a <picture> when resized variants exist"""
+    src = text(public_url(row.image_url, uploads))
+    variants = getattr(row, 'variants', None) or []
+    if not variants:
+        return [f'<img src="{src}" {attrs}>']
+
+    def srcset(fmt):
+        return ', '.join(f'{text(public_url(v.url, uploads))} {v.width}w' for v in variants if v.format == fmt)
+
+    return [
+        '<picture>',
+        f'    <source type="image/webp" srcset="{srcset("webp")}" sizes="{sizes}">',
+        f'    <img src="{src}" srcset="{srcset("jpeg")}" sizes="{sizes}" {attrs}>',
+        '</picture>',
+    ]
+
+
+# ---- Fragment renderers: name -> fn(ctx) returning a string or a list of lines ----
+
+def render_hero_title(ctx):
+    hero = ctx['hero']
+    return [
+        f'<span class="title-line">{text(hero.title_line1)}</span>',
+        f'<span class="title-line highlight-text">{text(hero.title_line2)}</span>',
+    ]
+
+def render_hero_subtitle(ctx):
+    hero = ctx['hero']
+    return [f'<span class="subtitle-word">{text(word)}</span>'
+            for word in (hero.subtitle_word1, hero.subtitle_word2, hero.subtitle_word3)]
+
+def render_hero_stats(ctx):
+    hero = ctx['hero']
+    stats = [(hero.stat_students, 'Students'), (hero.stat_programs, 'Programs'), (hero.stat_faculty, 'Expert Faculty')]
+    lines = []
+    for i, (value, label) in enumerate(stats):
+        if i:
+            lines.append('<div class="stat-divider"></div>')
+        lines += [
+            '<div class="stat-item">',
+            f'    <div class="stat-number" data-target="{int(value or 0)}">0</div>',
+            f'    <div class="stat-label">{label}</div>',
+            '</div>',
+        ]
+    return lines
+
+def render_about_paragraphs(ctx):
+    about = ctx['about']
+    paragraphs = [p for p in (about.paragraph1, about.paragraph2, about.paragraph3) if p]
+    lines = []
+    for i, paragraph in enumerate(paragraphs):
+        if i:
+            lines.append('')
+        lines.append(f'<p>{emphasise(text(paragraph), ctx["emphasis"])}</p>')
+    return lines
+
+def render_course_cards(ctx):
+    lines = []
+    for i, course in enumerate(ctx['courses']):
+        if i:
+            lines.append('')
+        lines += [
+            '<div class="course-card">',
+            '    <div class="course-image-container">',
+            *('        ' + line for line in image_tag(
+                course, f'alt="{text(course.title)} Course" class="course-image"',
+                '(max-width: 768px) 100vw, 33vw', ctx['uploads'])),
+            '        <div class="course-overlay">',
+            f'            <a href="{text(course.slug)}.html" class="btn-view">View Details</a>',
+            '        </div>',
+            '    </div>',
+            '    <div class="course-content">',
+            f'        <h3 class="course-title">{text(course.title)}</h3>',
+            f'        <p class="course-description">{text(course.short_description)}</p>',
+            '    </div>',
+            '</div>',
+        ]
+    return lines
+
+def render_gallery_items(ctx):
+    lines = []
+    for image in ctx['gallery']:
+        lines += [
+            '<div class="gallery-item">',
+            *('    ' + line for line in image_tag(
+                image, f'alt="{text(image.alt_text)}" loading="lazy"',
+                '(max-width: 768px) 100vw, 33vw', ctx['uploads'])),
+            '    <div class="gallery-overlay">',
+            *('        ' + line for line in GALLERY_ICON),
+            '    </div>',
+            '</div>',
+        ]
+    return lines
+
+def render_contact_location(ctx):
+    return [f'<p>{multiline(ctx["contact"].location)}</p>']
+
+def render_course_head_title(ctx):
+    return [f'<title>{text(ctx["course"].title)} - NIHOM</title>']
+
+def render_course_hero(ctx):
+    course = ctx['course']
+    return [
+        *image_tag(course, f'alt="{text(course.title)}"', '(max-width: 800px) 100vw, 800px', ctx['uploads']),
+        f'<h1>{text(course.title)}</h1>',
+        f'<p>{text(course.short_description)}</p>',
+    ]
+
+
+RENDERERS = {
+    'hero.title': render_hero_title,
+    'hero.subtitle': render_hero_subtitle,
+    'hero.stats': render_hero_stats,
+    'about.paragraphs': render_about_paragraphs,
+    'courses.cards': render_course_cards,
+    'gallery.items': render_gallery_items,
+    'contact.location': render_contact_location,
+    'course.head_title': render_course_head_title,
+    'course.hero': render_course_hero,
+}
+
+
+def render_region(name: str, ctx: dict):
+    if name in RENDERERS:
+        return RENDERERS[name](ctx)
+    # Plain `section.field` regions hold the escaped column value
+    section, _, field = name.partition('.')
+    return text(getattr(ctx[section], field))
+
+
+def render_page(source: str, ctx: dict) -> str:
+    """Replace the body of every cms region in source"""
+    def replace(match):
+        name = match.group('name')
+        fragment = render_region(name, {**ctx, 'emphasis': EMPHASIS_RE.findall(match.group('body'))})
+        if isinstance(fragment, list):
+            line_start = source.rfind('\n', 0, match.start()) + 1
+            indent = source[line_start:match.start()]
+            body = '\n' + ''.join(f'{indent}{line}\n' if line else '\n' for line in fragment) + indent
+        else:
+            body = fragment
+        return f'<!-- cms:{name} -->{body}<!-- /cms:{name} -->'
+    return REGION_RE.sub(replace, source)
+
+
+def page_sections(source: str) -> list:
+    """Section names a page depends on, derived from its region markers"""
+    return sorted({match.group('name').split('.')[0] for match in REGION_RE.finditer(source)})
+
+
+def digest(data) -> str:
+    return hashlib.sha256(data if isinstance(data, bytes) else serialize(data)).hexdigest()
+
+
+def write_atomic(path: Path, data: bytes):
+    tmp = path.with_name(f'.{path.name}.tmp')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def load_manifest(out_dir: Path) -> dict:
+    try:
+        return json.loads((out_dir / MANIFEST_NAME).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+
+def sync_file(src: Path, dest: Path) -> bool:
+    """Copy src over dest unless dest already has the same size and mtime"""
+    try:
+        s, d = src.stat(), dest.stat()
+        if s.st_size == d.st_size and int(s.st_mtime) == int(d.st_mtime):
+            return False
+    except FileNotFoundError:
+        if not src.exists():
+            return False
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copy2(src, dest)
+    return True
+
+
+def page_context(template: Path, sections: list, site: dict, courses_by_slug: dict) -> Optional[dict]:
+    """Rows a page is rendered from; None when one of them is missing"""
+    ctx = {name: site[name] for name in sections if name in SECTIONS}
+    if 'course' in sections:
+        ctx['course'] = courses_by_slug.get(template.stem)
+    if any(ctx.get(name) is None for name in sections):
+        return None
+    return ctx
+
+
+def publish(db: Session, out_dir: Path = None, template_dir: Path = None, force: bool = False) -> dict:
+    """Render every templated page whose source rows changed.
+
+    Returns a report listing the rendered and unchanged pages.
+    """
+    template_dir = Path(template_dir or settings.FRONTEND_DIR)
+    out_dir = Path(out_dir or settings.PUBLISH_DIR)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    in_place = template_dir.resolve() == out_dir.resolve()
+
+    if not in_place:
+        for src in template_dir.rglob('*'):
+            if src.is_file() and src.suffix != '.html':
+                sync_file(src, out_dir / src.relative_to(template_dir))
+
+    # Rendering into a separate directory also runs the build stage: minified
+    # CSS/JS under content-hashed names, critical CSS inlined, minified pages.
+    # In place the templates have to stay as they are.
+    assets = {} if in_place else fingerprint_assets(out_dir, transform=minify_asset)
+
+    def finish(html: str) -> str:
+        return html if in_place else build_page(html, out_dir, assets)[0]
+
+    site = load_site(db)
+    courses_by_slug = {course.slug: course for course in load_courses(db, active_only=False)}
+    manifest = load_manifest(out_dir)
+    new_manifest = {'version': RENDER_VERSION, 'pages': {}}
+    report = {'rendered': [], 'unchanged': []}
+    uploads = set()
+
+    for template in sorted(template_dir.glob('*.html')):
+        source = template.read_text(encoding='utf-8')
+        sections = page_sections(source)
+        dest = out_dir / template.name
+        if not sections:
+            if not in_place:
+                output = finish(source).encode('utf-8')
+                if not dest.exists() or dest.read_bytes() != output:
+                    write_atomic(dest, output)
+            continue
+
+        ctx = page_context(template, sections, site, courses_by_slug)
+        if ctx is None:
+            continue
+
+        # The template counts too: edited by hand, it is not the output file
+        page_digest = digest({'version': RENDER_VERSION, 'data': ctx, 'assets': assets, 'template': digest(source)})
+        previous = manifest.get('pages', {}).get(template.name, {})
+        current_digest = digest(dest.read_bytes()) if dest.exists() else None
+
+        if not force and previous.get('data') == page_digest and previous.get('output') == current_digest:
+            report['unchanged'].append(template.name)
+            new_manifest['pages'][template.name] = previous
+            for url in previous.get('uploads', []):
+                uploads.add(url)
+            continue
+
+        page_uploads = set()
+        ctx['uploads'] = page_uploads
+        output = finish(render_page(source, ctx)).encode('utf-8')
+        output_digest = digest(output)
+        if output_digest == current_digest:
+            report['unchanged'].append(template.name)
+        else:
+            write_atomic(dest, output)
+            report['rendered'].append(template.name)
+        uploads |= page_uploads
+        new_manifest['pages'][template.name] = {
+            'data': page_digest,
+            'output': output_digest,
+            'uploads': sorted(page_uploads),
+        }
+
+    # Uploaded images referenced by the pages have to ship with them
+    for name in sorted(uploads):
+        sync_file(settings.UPLOAD_DIR / name, out_dir / 'uploads' / name)
+
+    write_atomic(out_dir / MANIFEST_NAME, json.dumps(new_manifest, indent=2, sort_keys=True).encode('utf-8'))
+    # Refresh the .gz/.br siblings of whatever changed
+    precompress(out_dir)
+    return report
+
+
+def publish_once() -> bool:
+    """Publish into a PUBLISH_DIR that was never published to. Returns whether this process did it.
+
+    Workers starting together would all find it empty, so this runs under
+    the migration lock and checks again once the lock is held.
+    """
+    manifest = settings.PUBLISH_DIR / MANIFEST_NAME
+    if manifest.exists():
+        return False
+    from migrations import lock_path, migration_lock
+    from models import engine
+    with migration_lock(lock_path(engine)):
+        if manifest.exists():
+            return False
+        db = SessionLocal()
+        try:
+            publish(db)
+        finally:
+            db.close()
+    return True
+
+
+# The live pages were edited after the seed data was written, and the seed
+# keeps its original text: these regions are not compared
+SEED_DRIFT = ('contact.email', 'mission-vision.mission_text', 'mission-vision.vision_text')
+
+
+def seed_differences(template_dir: Path = None) -> list:
+    """Templates that rendering the seed data would change; [] when it is a no-op"""
+    from migrations import migrate
+    from models import create_db_engine, seed_db
+    template_dir = Path(template_dir or settings.FRONTEND_DIR)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_db_engine(f"sqlite:///{Path(tmp) / 'seed.db'}")
+        try:
+            migrate(engine)
+            with Session(engine) as db:
+                seed_db(db)
+                site = load_site(db)
+                courses_by_slug = {course.slug: course for course in load_courses(db, active_only=False)}
+        finally:
+            engine.dispose()
+
+    changed = []
+    for template in sorted(template_dir.glob('*.html')):
+        source = template.read_text(encoding='utf-8')
+        sections = page_sections(source)
+        ctx = page_context(template, sections, site, courses_by_slug) if sections else None
+        if ctx is None:
+            continue
+        ctx['uploads'] = set()
+        kept = {m.group('name'): m.group() for m in REGION_RE.finditer(source) if m.group('name') in SEED_DRIFT}
+        rendered = REGION_RE.sub(lambda m: kept.get(m.group('name'), m.group()), render_page(source, ctx))
+        if rendered != source:
+            changed.append(template.name)
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render the NIHOM website from the database')
+    parser.add_argument('--out', type=Path, help=f'output directory (default: {settings.PUBLISH_DIR})')
+    parser.add_argument('--force', action='store_true', help='rebuild every page')
+    parser.add_argument('--check-seed', action='store_true',
+                        help='fail if rendering the seed data would change the templates')
+    args = parser.parse_args()
+
+    if args.check_seed:
+        changed = seed_differences()
+        for name in changed:
+            print(f"[FAIL] Publishing the seed data changes {name}")
+        if changed:
+            sys.exit(1)
+        print("[OK] Publishing the seed data leaves every page as it is")
+        return
+
+    db = SessionLocal()
+    try:
+        report = publish(db, out_dir=args.out, force=args.force)
+    finally:
+        db.close()
+    for name in report['rendered']:
+        print(f"[OK] Rendered {name}")
+    print(f"[OK] {len(report['rendered'])} rendered, {len(report['unchanged'])} unchanged")
+
+
+if __name__ == '__main__':
+    main()
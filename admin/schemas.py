@@ -0,0 +1,126 @@
+"""Response schemas for the content endpoints"""
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class Schema(BaseModel):
+    # Loaders build these from row mappings; from_attributes also lets a
+    # handler that already holds an ORM instance wrap it
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ImageVariantOut(Schema):
+    url: str
+    width: int
+    height: int
+    format: str
+
+
+class HeroContentOut(Schema):
+    id: int
+    badge_text: Optional[str] = None
+    title_line1: Optional[str] = None
+    title_line2: Optional[str] = None
+    subtitle_word1: Optional[str] = None
+    subtitle_word2: Optional[str] = None
+    subtitle_word3: Optional[str] = None
+    description: Optional[str] = None
+    stat_students: Optional[int] = None
+    stat_programs: Optional[int] = None
+    stat_faculty: Optional[int] = None
+    updated_at: Optional[datetime] = None
+
+
+class AboutContentOut(Schema):
+    id: int
+    section_tag: Optional[str] = None
+    section_title: Optional[str] = None
+    lead_text: Optional[str] = None
+    paragraph1: Optional[str] = None
+    paragraph2: Optional[str] = None
+    paragraph3: Optional[str] = None
+    updated_at: Optional[datetime] = None
+
+
+class MissionVisionOut(Schema):
+    id: int
+    mission_text: Optional[str] = None
+    vision_text: Optional[str] = None
+    updated_at: Optional[datetime] = None
+
+
+class CourseOut(Schema):
+    id: int
+    slug: Optional[str] = None
+    title: Optional[str] = None
+    short_description: Optional[str] = None
+    image_url: Optional[str] = None
+    is_active: bool = True
+    display_order: int = 0
+    updated_at: Optional[datetime] = None
+    variants: list[ImageVariantOut] = []
+
+
+class GalleryImageOut(Schema):
+    id: int
+    image_url: Optional[str] = None
+    alt_text: Optional[str] = None
+    caption: Optional[str] = None
+    display_order: int = 0
+    is_active: bool = True
+    updated_at: Optional[datetime] = None
+    variants: list[ImageVariantOut] = []
+
+
+class ContactInfoOut(Schema):
+    id: int
+    location: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    updated_at: Optional[datetime] = None
+
+
+class SiteOut(Schema):
+    """The /api/public/site bundle; sections not requested are omitted"""
+    hero: Optional[HeroContentOut] = None
+    about: Optional[AboutContentOut] = None
+    mission_vision: Optional[MissionVisionOut] = Field(None, alias='mission-vision')
+    courses: Optional[list[CourseOut]] = None
+    gallery: Optional[list[GalleryImageOut]] = None
+    contact: Optional[ContactInfoOut] = None
+
+
+# ---- Batch updates ----
+
+MAX_BATCH_ITEMS = 500
+
+
+class CourseBatchItem(BaseModel):
+    """Partial update of one course; omitted fields are left unchanged"""
+    id: int
+    title: Optional[str] = None
+    short_description: Optional[str] = None
+    image_url: Optional[str] = None
+    is_active: Optional[bool] = None
+    display_order: Optional[int] = None
+
+
+class GalleryImageBatchItem(BaseModel):
+    """Partial update of one gallery image; omitted fields are left unchanged"""
+    id: int
+    image_url: Optional[str] = None
+    alt_text: Optional[str] = None
+    caption: Optional[str] = None
+    is_active: Optional[bool] = None
+    display_order: Optional[int] = None
+
+
+class BatchItemResult(BaseModel):
+    id: int
+    status: str  # updated | unchanged | not_found
+
+
+class BatchResult(BaseModel):
+    updated: int
+    results: list[BatchItemResult]
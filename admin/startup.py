@@ -0,0 +1,67 @@
+"""Application start-up, timed phase by phase.
+
+initialize() brings the schema up to date, seeds an empty database, renders
+the site into an empty PUBLISH_DIR and loads the admin panel, then logs how long each phase took (plus the import of the
+app, when the caller passes its start time). It runs once per process: under
+gunicorn --preload (see gunicorn.conf.py) the master runs it before forking,
+and the workers, which inherit the done flag and the loaded panel, skip it.
+
+On a warm database the schema check is one SELECT and the seed check another.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import models
+from admin_panel import panel
+from publish import publish_once
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    def __init__(self):
+        self.phases: dict = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = (time.perf_counter() - started) * 1000
+
+    @property
+    def total_ms(self) -> float:
+        return sum(self.phases.values())
+
+    def summary(self) -> str:
+        return ', '.join(f"{name} {ms:.1f}ms" for name, ms in self.phases.items())
+
+
+_initialized = False
+
+
+def initialize(import_started: Optional[float] = None) -> Optional[StartupTimer]:
+    """Run start-up unless this process (or the master it forked from) already did"""
+    global _initialized
+    if _initialized:
+        return None
+    timer = StartupTimer()
+    if import_started is not None:
+        timer.phases['import'] = (time.perf_counter() - import_started) * 1000
+    with timer.phase('schema'):
+        models.check_schema()
+    with timer.phase('seed'):
+        seeded = models.seed_once()
+    with timer.phase('publish'):
+        published = publish_once()
+    with timer.phase('admin panel'):
+        panel.current()
+    _initialized = True
+    logger.info(f"Started in {timer.total_ms:.1f}ms ({timer.summary()})",
+                extra={'startup_ms': round(timer.total_ms, 1),
+                       'phases_ms': {name: round(ms, 1) for name, ms in timer.phases.items()},
+                       'seeded': seeded, 'published': published})
+    return timer
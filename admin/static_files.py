@@ -0,0 +1,232 @@
+"""Static file serving for the website and uploaded images.
+
+Only the published site (settings.PUBLISH_DIR, under /static/frontend/) and
+the uploads (settings.UPLOAD_DIR, under /static/uploads/) are reachable;
+the database, sources and dotfiles such as the upload staging area are not.
+
+Every request costs one stat() of the file (plus one per compressed sibling
+tried). Small files are kept in a bounded LRU cache together with their
+validators and headers, so a hot file is answered without opening it; an
+entry is reused as long as the file's inode, mtime and size are unchanged.
+Large files are streamed from disk, zero-copy when the server offers the
+ASGI pathsend extension.
+
+`.br`/`.gz` siblings written by compression.py are sent to clients that
+accept them, with the validators of the source file.
+"""
+import mimetypes
+import os
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from stat import S_ISREG
+from typing import NamedTuple, Optional
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, PlainTextResponse, Response
+from starlette.types import Receive, Scope, Send
+
+from compression import SUFFIXES, TEXT_SUFFIXES, accepted, cache_control_for
+from config import settings
+
+
+class CachedFile(NamedTuple):
+    # (inode, mtime, size) of the file the entry was made from
+    key: tuple
+    # The content, or None for files too large to keep in memory
+    body: Optional[bytes]
+
+    @property
+    def cost(self) -> int:
+        return ENTRY_OVERHEAD + (len(self.body) if self.body is not None else 0)
+
+
+# Rough bookkeeping size of an entry, so entries of large files count too
+ENTRY_OVERHEAD = 256
+
+
+class FileCache:
+    """LRU cache of file entries, bounded by total bytes.
+
+    Small files are cached with their content; large ones only to remember
+    that they were checked.
+    """
+
+    def __init__(self, max_bytes: int, max_file_size: int):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.size = 0
+        self._entries: 'OrderedDict[str, CachedFile]' = OrderedDict()
+
+    def get(self, path: str, key: tuple) -> Optional[CachedFile]:
+        entry = self._entries.get(path)
+        if entry is None:
+            return None
+        if entry.key != key:
+            self.discard(path)
+            return None
+        self._entries.move_to_end(path)
+        return entry
+
+    def put(self, path: str, entry: CachedFile):
+        self.discard(path)
+        if entry.cost > self.max_bytes:
+            return
+        self._entries[path] = entry
+        self.size += entry.cost
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted.cost
+
+    def discard(self, path: str):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self.size -= entry.cost
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+
+def stat_key(stat: os.stat_result) -> tuple:
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def etag_for(stat: os.stat_result) -> str:
+    return f'"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def not_modified(request_headers: Headers, etag: str, stat: os.stat_result) -> bool:
+    if_none_match = request_headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return etag in tags or '*' in tags
+    if_modified_since = request_headers.get('if-modified-since')
+    if if_modified_since:
+        try:
+            return int(stat.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class PathsendFileResponse(FileResponse):
+    """FileResponse that hands the file to the server when it supports pathsend"""
+
+    chunk_size = 256 * 1024
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if 'http.response.pathsend' not in scope.get('extensions', {}) or scope['method'] == 'HEAD':
+            await super().__call__(scope, receive, send)
+            return
+        await send({'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers})
+        await send({'type': 'http.response.pathsend', 'path': os.fspath(self.path)})
+        if self.background is not None:
+            await self.background()
+
+
+class StaticFileEngine:
+    """ASGI app serving files from a fixed set of named directories"""
+
+    def __init__(self, roots: dict, cache: FileCache):
+        self.roots = {name: Path(directory).resolve() for name, directory in roots.items()}
+        self.cache = cache
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        assert scope['type'] == 'http'
+        if scope['method'] not in ('GET', 'HEAD'):
+            response = PlainTextResponse('Method Not Allowed', status_code=405, headers={'Allow': 'GET, HEAD'})
+        else:
+            response = await self.get_response(scope)
+        await response(scope, receive, send)
+
+    def resolve(self, route_path: str) -> Optional[Path]:
+        """The file a request path names, or None if it is outside the served roots"""
+        root_name, _, rest = route_path.lstrip('/').partition('/')
+        root = self.roots.get(root_name)
+        parts = rest.split('/')
+        if root is None or any(not part or part.startswith('.') or '\\' in part for part in parts):
+            return None
+        return root.joinpath(*parts)
+
+    def _stat(self, path: Path) -> Optional[os.stat_result]:
+        try:
+            stat = os.stat(path)
+        except (OSError, ValueError):
+            return None
+        return stat if S_ISREG(stat.st_mode) else None
+
+    def _inside_roots(self, path: Path) -> bool:
+        """Symlinks must not lead out of the served directories"""
+        real = path.resolve()
+        return any(real.is_relative_to(root) for root in self.roots.values())
+
+    async def _load(self, path: Path, stat: os.stat_result) -> Optional[CachedFile]:
+        key = stat_key(stat)
+        entry = self.cache.get(str(path), key)
+        if entry is not None:
+            return entry
+        if not await anyio.to_thread.run_sync(self._inside_roots, path):
+            return None
+        body = None
+        if stat.st_size <= self.cache.max_file_size:
+            body = await anyio.to_thread.run_sync(path.read_bytes)
+            if len(body) != stat.st_size:  # changed while we read it; stream it this time
+                return CachedFile(key, None)
+        entry = CachedFile(key, body)
+        self.cache.put(str(path), entry)
+        return entry
+
+    async def get_response(self, scope: Scope) -> Response:
+        root_path = scope.get('root_path', '')
+        route_path = scope['path'][len(root_path):] if scope['path'].startswith(root_path) else scope['path']
+        path = self.resolve(route_path)
+        stat = self._stat(path) if path is not None else None
+        if stat is None:
+            return PlainTextResponse('Not Found', status_code=404)
+
+        request_headers = Headers(scope=scope)
+        media_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+        headers = {
+            'ETag': etag_for(stat),
+            'Last-Modified': formatdate(stat.st_mtime, usegmt=True),
+        }
+        cache_control = cache_control_for(path.name)
+        if cache_control:
+            headers['Cache-Control'] = cache_control
+        is_text = path.suffix.lower() in TEXT_SUFFIXES
+        if is_text:
+            headers['Vary'] = 'Accept-Encoding'
+
+        if not_modified(request_headers, headers['ETag'], stat):
+            return Response(status_code=304, headers=headers)
+
+        send_path, send_stat = path, stat
+        if is_text:
+            for encoding in accepted(request_headers.get('accept-encoding')):
+                sibling = path.with_name(path.name + SUFFIXES[encoding])
+                sibling_stat = self._stat(sibling)
+                if sibling_stat is None or sibling_stat.st_mtime < stat.st_mtime:
+                    continue  # missing, or stale: the source changed after it was compressed
+                send_path, send_stat = sibling, sibling_stat
+                # The compressed bytes differ, so the validator can only be weak
+                headers['ETag'] = 'W/' + headers['ETag']
+                headers['Content-Encoding'] = encoding
+                break
+
+        entry = await self._load(send_path, send_stat)
+        if entry is None:
+            return PlainTextResponse('Not Found', status_code=404)
+        if entry.body is not None:
+            return Response(entry.body, media_type=media_type, headers=headers)
+        response = PathsendFileResponse(send_path, media_type=media_type, stat_result=send_stat)
+        response.headers.update(headers)
+        return response
+
+
+def create_static_app() -> StaticFileEngine:
+    return StaticFileEngine(
+        {'frontend': settings.PUBLISH_DIR, 'uploads': settings.UPLOAD_DIR},
+        FileCache(settings.STATIC_CACHE_BYTES, settings.STATIC_CACHE_MAX_FILE),
+    )
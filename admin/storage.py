@@ -0,0 +1,335 @@
+"""Content-addressed storage for uploaded files.
+
+Every upload is hashed while it is written and stored once, under its
+SHA-256 digest, as uploads/<digest><ext>. The name the user picked is kept
+as metadata in the uploaded_files table. Uploading identical bytes again
+returns the existing file, and because a URL can never point at different
+content, it can be cached forever.
+
+Multipart request bodies are parsed as they arrive (receive_uploads): file
+data goes straight to a temp file from a worker thread, the size limit is
+enforced while streaming, and the finished file is renamed into place.
+Zip archives can be unpacked into storage the same way (extract_zip).
+"""
+import asyncio
+import hashlib
+import os
+import re
+import uuid
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+import multipart
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import parse_options_header
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config import settings
+from metrics import registry, timed
+from models import UploadedFile
+
+CHUNK_SIZE = 64 * 1024
+# Buffered file data is handed to the writer thread in blocks of this size
+WRITE_BLOCK_SIZE = 256 * 1024
+# Plain form fields are kept in memory, so they get a small limit of their own
+MAX_FIELD_BYTES = 64 * 1024
+TMP_DIR = '.tmp'
+
+# Uploads beyond this many per worker wait before their body is read, so
+# slow clients are held back by TCP flow control instead of filling memory
+upload_slots = asyncio.Semaphore(settings.MAX_CONCURRENT_UPLOADS)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def safe_suffix(filename: Optional[str]) -> str:
+    """Lower-cased extension of filename, or '' if it is not a plain one"""
+    suffix = Path(filename or '').suffix.lower()
+    return suffix if re.fullmatch(r'\.[a-z0-9]{1,8}', suffix) else ''
+
+
+def tmp_path() -> Path:
+    tmp_dir = settings.UPLOAD_DIR / TMP_DIR
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    return tmp_dir / uuid.uuid4().hex
+
+
+def commit_file(tmp: Path, digest: str, filename: str) -> tuple:
+    """Move a fully written temp file to its content address.
+
+    Returns (path, created); when the content is already stored the temp
+    file is discarded and created is False.
+    """
+    # The same bytes may already be stored under another extension
+    for existing in settings.UPLOAD_DIR.glob(f"{digest}*"):
+        if existing.is_file():
+            tmp.unlink(missing_ok=True)
+            return existing, False
+    dest = settings.UPLOAD_DIR / f"{digest}{safe_suffix(filename)}"
+    os.replace(tmp, dest)
+    return dest, True
+
+
+class HashingWriter:
+    """Writes one upload to a temp file, hashing and size-checking every block.
+
+    All methods do blocking I/O and are meant to run in a worker thread.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.tmp = tmp_path()
+        self.file = self.tmp.open('wb')
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise UploadTooLarge(f"File exceeds the {self.max_size} byte limit")
+        self.sha256.update(data)
+        self.file.write(data)
+
+    def finish(self, filename: str) -> tuple:
+        """Close and move into place. Returns (path, digest, size, created)"""
+        self.file.close()
+        digest = self.sha256.hexdigest()
+        path, created = commit_file(self.tmp, digest, filename)
+        return path, digest, self.size, created
+
+    def abort(self):
+        self.file.close()
+        self.tmp.unlink(missing_ok=True)
+
+
+def store_stream(source: BinaryIO, filename: str, max_size: int = None) -> tuple:
+    """Copy a file object to storage, hashing it on the way. Returns (path, digest, size, created)"""
+    writer = HashingWriter(max_size or settings.MAX_UPLOAD_BYTES)
+    try:
+        while chunk := source.read(CHUNK_SIZE):
+            writer.write(chunk)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.finish(filename)
+
+
+@dataclass
+class ReceivedFile:
+    filename: str
+    content_type: Optional[str]
+    path: Path
+    sha256: str
+    size: int
+    created: bool
+
+
+class _MultipartEvents:
+    """Collects python-multipart callbacks so they can be handled asynchronously"""
+
+    def __init__(self):
+        self.events = []
+        self._header_field = b''
+        self._header_value = b''
+        self.callbacks = {
+            'on_part_begin': lambda: self.events.append(('begin', None)),
+            'on_part_data': lambda data, start, end: self.events.append(('data', data[start:end])),
+            'on_part_end': lambda: self.events.append(('end', None)),
+            'on_header_field': self._on_header_field,
+            'on_header_value': self._on_header_value,
+            'on_header_end': self._on_header_end,
+        }
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self.events.append(('header', (self._header_field.lower(), self._header_value)))
+        self._header_field = self._header_value = b''
+
+    def drain(self) -> list:
+        events, self.events = self.events, []
+        return events
+
+
+def _discard(writer: Optional[HashingWriter], files: list):
+    """Remove the partial file and the files a failed request stored"""
+    if writer is not None:
+        writer.abort()
+    for f in files:
+        if f.created:
+            f.path.unlink(missing_ok=True)
+
+
+async def receive_uploads(request: Request, max_files: int = 1, max_size: int = None, max_total: int = None) -> tuple:
+    """Stream the file parts of a multipart request into storage.
+
+    Returns (files, fields): the stored files as ReceivedFile and the plain
+    form fields as a dict. Raises HTTPException 413 when a file is larger
+    than max_size, the files add up to more than max_total, there are more
+    than max_files files or a plain field is over MAX_FIELD_BYTES, and 400
+    when the body is not well-formed multipart/form-data. Files this request
+    stored are removed again when it fails.
+    """
+    max_size = max_size or settings.MAX_UPLOAD_BYTES
+    max_total = max_total or max_files * max_size
+    content_type, params = parse_options_header(request.headers.get('content-type', ''))
+    if content_type != b'multipart/form-data' or b'boundary' not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
+    # Files plus room for part headers and form fields; a chunked body has
+    # no Content-Length, so what is streamed is counted against it as well
+    max_body = max_total + CHUNK_SIZE * max_files
+    content_length = int(request.headers.get('content-length') or 0)
+    if content_length > max_body:
+        raise HTTPException(status_code=413, detail="Upload too large")
+
+    events = _MultipartEvents()
+    parser = multipart.MultipartParser(params[b'boundary'], events.callbacks)
+    files, fields = [], {}
+    headers, options, writer, buffer = {}, None, None, bytearray()
+    streamed = 0
+
+    async def flush():
+        if buffer:
+            await run_in_threadpool(writer.write, bytes(buffer))
+            buffer.clear()
+
+    async with upload_slots:
+        with timed('nihom_upload_receive_seconds'):
+            try:
+                async for chunk in request.stream():
+                    streamed += len(chunk)
+                    if streamed > max_body:
+                        raise UploadTooLarge("Upload too large")
+                    parser.write(chunk)
+                    for kind, value in events.drain():
+                        if kind == 'begin':
+                            headers, options, writer = {}, None, None
+                            buffer.clear()
+                        elif kind == 'header':
+                            headers[value[0]] = value[1]
+                        elif kind in ('data', 'end'):
+                            if options is None:
+                                _, options = parse_options_header(headers.get(b'content-disposition', b''))
+                                if b'filename' in options:
+                                    if len(files) >= max_files:
+                                        raise UploadTooLarge(f"At most {max_files} files per request")
+                                    received = sum(f.size for f in files)
+                                    if received >= max_total:
+                                        raise UploadTooLarge(f"Files exceed the {max_total} byte limit")
+                                    writer = await run_in_threadpool(HashingWriter, min(max_size, max_total - received))
+                            if kind == 'data':
+                                buffer += value
+                                if writer is not None:
+                                    if len(buffer) >= WRITE_BLOCK_SIZE:
+                                        await flush()
+                                elif len(buffer) > MAX_FIELD_BYTES:
+                                    raise UploadTooLarge(f"Form fields are limited to {MAX_FIELD_BYTES} bytes")
+                            elif writer is not None:
+                                await flush()
+                                filename = options[b'filename'].decode('utf-8', 'replace')
+                                path, digest, size, created = await run_in_threadpool(writer.finish, filename)
+                                writer = None
+                                part_type = headers.get(b'content-type')
+                                files.append(ReceivedFile(
+                                    filename, part_type.decode('latin-1') if part_type else None,
+                                    path, digest, size, created,
+                                ))
+                            else:
+                                name = options.get(b'name', b'').decode('utf-8', 'replace')
+                                fields[name] = buffer.decode('utf-8', 'replace')
+                                buffer.clear()
+                parser.finalize()
+            except BaseException as e:
+                await run_in_threadpool(_discard, writer, files)
+                if isinstance(e, UploadTooLarge):
+                    raise HTTPException(status_code=413, detail=str(e))
+                if isinstance(e, MultipartParseError):
+                    raise HTTPException(status_code=400, detail="Malformed multipart/form-data body")
+                raise
+    registry.inc('nihom_upload_bytes_total', value=sum(f.size for f in files))
+    return files, fields
+
+
+def extract_zip(archive: Path, suffixes: tuple, max_files: int, max_size: int = None,
+                max_total: int = None) -> tuple:
+    """Store every member of archive whose extension is in suffixes.
+
+    Blocking; run it in a worker thread. Member sizes are enforced on the
+    decompressed bytes, not on what the archive claims: a member larger
+    than max_size is skipped, and UploadTooLarge is raised (after removing
+    what this call stored) once the stored members would exceed max_total
+    bytes together. Returns (stored, skipped): ReceivedFile entries and
+    (name, reason) pairs. Raises zipfile.BadZipFile when archive is not a
+    zip file.
+    """
+    max_size = max_size or settings.MAX_UPLOAD_BYTES
+    max_total = settings.MAX_IMPORT_BYTES if max_total is None else max_total
+    stored, skipped = [], []
+    total = 0
+    try:
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                name = info.filename
+                base = Path(name).name
+                if info.is_dir() or base.startswith('.') or '__MACOSX/' in name:
+                    continue
+                if safe_suffix(base) not in suffixes:
+                    skipped.append((name, "not an image"))
+                elif len(stored) >= max_files:
+                    skipped.append((name, f"more than {max_files} files"))
+                elif info.file_size > max_size:
+                    skipped.append((name, "too large"))
+                elif total + info.file_size > max_total:
+                    raise UploadTooLarge(f"Archive contents exceed the {max_total} byte limit")
+                else:
+                    # The header may understate the size: also stop at what the total allows
+                    limit = min(max_size, max_total - total)
+                    try:
+                        with zf.open(info) as member:
+                            path, digest, size, created = store_stream(member, base, limit)
+                    except UploadTooLarge:
+                        if limit < max_size:
+                            raise UploadTooLarge(f"Archive contents exceed the {max_total} byte limit")
+                        skipped.append((name, "too large"))
+                        continue
+                    total += size
+                    stored.append(ReceivedFile(base, None, path, digest, size, created))
+    except UploadTooLarge:
+        for f in stored:
+            if f.created:
+                f.path.unlink(missing_ok=True)
+        raise
+    return stored, skipped
+
+
+def record_upload(db: Session, digest: str, path: Path, filename: str, content_type: Optional[str], size: int) -> tuple:
+    """Return (row, created) for digest, creating the metadata row on first upload"""
+    existing = db.query(UploadedFile).filter(UploadedFile.sha256 == digest).first()
+    if existing:
+        return existing, False
+    uploaded = UploadedFile(
+        sha256=digest,
+        url=f"uploads/{path.name}",
+        original_name=filename,
+        content_type=content_type,
+        size=size,
+    )
+    db.add(uploaded)
+    try:
+        db.commit()
+    except IntegrityError:
+        # The same content was uploaded concurrently
+        db.rollback()
+        return db.query(UploadedFile).filter(UploadedFile.sha256 == digest).one(), False
+    return uploaded, True